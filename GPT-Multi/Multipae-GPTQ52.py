@@ -0,0 +1,358 @@
+import argparse
+import pandas as pd
+import seaborn as sns
+import matplotlib.pyplot as plt
+import os
+import re
+import glob
+import numpy as np
+from jinja2 import Environment, FileSystemLoader
+
+metrics_df = pd.DataFrame()
+image_file_names = []
+
+# i, j, pae_ij, pae_ji の列から、pivotを使わずにL×Lの行列へ直接書き込む関数
+# pivot→fillna→reindex→addと同じ値になるように、片方の向きにしか値がない行・列はNaNにします。
+def build_pae_matrix(i_values, j_values, pae_ij, pae_ji):
+    max_i = int(i_values.max())
+    max_j = int(j_values.max())
+    size = max(max_i, max_j)  # 行列の大きさ（1からsizeまで）
+    shared = min(max_i, max_j)  # 両方の向きの値がそろう範囲
+
+    # インデックス0以下はreindex(1から)で落ちるため使いません。
+    valid = (i_values >= 1) & (j_values >= 1)
+    rows = i_values[valid] - 1
+    columns = j_values[valid] - 1
+
+    matrix_ij = np.zeros((max_i, max_j))
+    matrix_ij[rows, columns] = np.nan_to_num(pae_ij[valid], nan=0.0)
+    matrix_ji = np.zeros((max_j, max_i))
+    matrix_ji[columns, rows] = np.nan_to_num(pae_ji[valid], nan=0.0)
+
+    combined_matrix = np.full((size, size), np.nan)
+    combined_matrix[:shared, :shared] = matrix_ij[:shared, :shared] + matrix_ji[:shared, :shared]
+
+    return combined_matrix
+
+# .raw.txtからPAE行列を読み込む関数（use_cacheがTrueなら.npyに保存し、次回は入力より新しい.npyを使います）
+def load_pae_matrix(file_path, df=None, use_cache=False):
+    cache_path = re.sub(r'\.raw\.txt$', '', file_path) + '.pae.npy'
+    if use_cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        return np.load(cache_path)
+
+    if df is None:
+        df = pd.read_csv(file_path, delimiter='\t', usecols=['i', 'j', 'pae_ij', 'pae_ji'])
+
+    combined_matrix = build_pae_matrix(df['i'].to_numpy(), df['j'].to_numpy(), df['pae_ij'].to_numpy(dtype=float), df['pae_ji'].to_numpy(dtype=float))
+
+    if use_cache:
+        np.save(cache_path, combined_matrix)
+
+    return combined_matrix
+
+def draw_heatmap(file_path, cmap='bwr', output_prefix=None, Alength=None, use_cache=False):
+    try:
+        # テキストファイルからデータをデータフレームに読み込みます。
+        df = pd.read_csv(file_path, delimiter='\t')
+        print("Dataframe loaded:")
+        print(df.head())
+        maxi=df['i'].max()+1
+
+        if Alength is not None:
+            filtered_df = df[(df['i'] <= Alength) & (df['j'] > Alength)]
+            avg_pae_ij = round(filtered_df['pae_ij'].mean(), 3)
+            avg_pae_ji = round(filtered_df['pae_ji'].mean(), 3)
+            sum_p_cbcb = filtered_df['p(cbcb<8)'].sum()
+            Sum_pcbcb_divA = round(sum_p_cbcb / Alength, 3)
+            Sum_pcbcb_divB = round(sum_p_cbcb / (maxi-Alength), 3)
+
+            print(f"Average pae_ij for i < {Alength} and j > {Alength}: {avg_pae_ij}")
+            print(f"Average pae_ji for i < {Alength} and j > {Alength}: {avg_pae_ji}")
+            print(f"Sum_pcbcb_divA for i < {Alength} and j > {Alength}: {Sum_pcbcb_divA}")
+            print(f"Sum_pcbcb_divB for i < {Alength} and j > {Alength}: {Sum_pcbcb_divB}")
+            print(maxi)
+
+        if Alength is not None:
+            filtered_df = df[(df['i'] <= Alength) & (df['j'] > Alength)]
+            i_mean_values = filtered_df.groupby('i')['p(cbcb<8)'].sum()
+            j_mean_values = filtered_df.groupby('j')['p(cbcb<8)'].sum()
+
+            suffix_i = f"{int(Sum_pcbcb_divA * 100):03d}"
+            suffix_j = f"{int(Sum_pcbcb_divB * 100):03d}"
+            
+            plt.figure(figsize=(10, 6))
+            i_mean_values.plot(kind='bar')
+            plt.xlabel('i')
+            plt.ylabel('Sum p(cbcb<8)')
+            plt.title('Sum p(cbcb<8) for i <= Alength and j > Alength (Grouped by i)')
+            plt.xticks(range(0, len(i_mean_values), 10), i_mean_values.index[::10])
+            plt.savefig(f'{output_prefix}_i_sum_bar_{suffix_i}.png')
+
+            plt.figure(figsize=(10, 6))
+            j_mean_values.plot(kind='bar')
+            plt.xlabel('j')
+            plt.ylabel('Sum p(cbcb<8)')
+            plt.title('Sum p(cbcb<8) for i <= Alength and j > Alength (Grouped by j)')
+            plt.xticks(range(0, len(j_mean_values), 10), j_mean_values.index[::10])
+            plt.savefig(f'{output_prefix}_j_sum_bar_{suffix_j}.png')
+
+
+        # i, j, pae_ij, pae_jiを1回でL×Lの行列に書き込み、ヒートマップ用のデータフレームを作成します。
+        combined_matrix = load_pae_matrix(file_path, df, use_cache)
+        residue_range = range(1, combined_matrix.shape[0] + 1)
+        combined_heatmap_df = pd.DataFrame(combined_matrix, index=residue_range, columns=residue_range)
+
+        # Save combined heatmap dataframe to CSV
+        combined_heatmap_df.to_csv(f"{output_prefix}_combined_heatmap.csv")
+        print(f"Combined heatmap dataframe saved to {output_prefix}_combined_heatmap.csv")
+        
+        print("Adjusted heatmap dataframe:")
+        print(combined_heatmap_df.head())
+
+        # ヒートマップを描画します。
+        plt.figure(figsize=(10, 8))
+        sns.heatmap(combined_heatmap_df, annot=False, fmt='.3f', cmap=cmap, linewidths=0, square=True, vmin=0, vmax=31)
+        plt.axhline(y=Alength, color='black', linewidth=1)  # Add a horizontal line at the Alength
+        plt.axvline(x=Alength, color='black', linewidth=1)  # Add a vertical line at the Alength
+        plt.title('2D Heatmap of pae_ij')
+        plt.savefig(f"{output_prefix}_2D_heatmap.png")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    return {
+        "output_prefix": output_prefix,
+        "rank": rank_number,
+        "avg_pae_ij": avg_pae_ij,
+        "avg_pae_ji": avg_pae_ji,
+        "Sum_pcbcb_divA": Sum_pcbcb_divA,
+        "Sum_pcbcb_divB": Sum_pcbcb_divB,
+        "suffix_i": suffix_i,
+        "suffix_j": suffix_j,
+    }
+
+
+def create_template_directory_and_file():
+    # Create the template directory if it does not exist
+    template_directory = 'templates'
+    if not os.path.exists(template_directory):
+        os.makedirs(template_directory)
+
+    # Create the template file
+    template_file = os.path.join(template_directory, 'output_template.html')
+    with open(template_file, 'w') as file:
+        file.write('''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Output</title>
+    <style>
+        table {
+            border-collapse: collapse;
+            width: 100%;
+        }
+        th, td {
+            border: 1px solid black;
+            padding: 8px;
+            text-align: left;
+        }
+        th {
+            background-color: #f2f2f2;
+        }
+        .image-container {
+            display: flex;
+            flex-wrap: wrap;
+        }
+        .image-wrapper {
+            flex: 1;
+        }
+        .image-wrapper img {
+            max-width: 100%;
+            height: auto;
+        }
+        .pae-image {
+            max-width: 20%;
+        }
+        .sum-image {
+            min-width: 50%;
+        }
+    </style>
+</head>
+<body>
+    <h1>Metrics Dataframe</h1>
+    {{ metrics_df | safe }}
+
+    <h1>Matrix by Rank</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if img_filename.endswith('metrics_by_rank.png') %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+
+    <h1>PAE</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if img_filename.endswith('_2D_heatmap.png') %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+
+    <h1>Other predicted images</h1>
+    <div class="image-container">
+        <div class="image-wrapper">
+            <img src="msa_coverage.png">
+        </div>
+        <div class="image-wrapper">
+            <img src="predicted_LDDT.png">
+        </div>
+    </div>
+
+    <h1>Sum p(cbcb<8)</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if '_i_sum_bar_' in img_filename %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if '_j_sum_bar_' in img_filename %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+</body>
+</html>
+''')
+        
+    return template_directory, template_file
+
+
+# Call the function to create the template directory and file
+template_directory, template_file = create_template_directory_and_file()
+
+# Set up the Jinja2 environment
+env = Environment(loader=FileSystemLoader(template_directory))
+template = env.get_template(os.path.basename(template_file))
+
+# Render the template with the metrics dataframe and image filenames
+output_html = template.render(metrics_df=metrics_df.to_html(classes='data', index=False),
+                              img_filenames=sorted(image_file_names))
+
+# Save the rendered HTML to a file
+with open('output.html', 'w') as file:
+    file.write(output_html)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Draw a 2D heatmap from a text file.')
+    parser.add_argument('file_pattern', type=str, nargs='?', default="rank_*_model_*_ptm_seed_*.raw.txt", help='File pattern to match input text files (e.g., "rank_*_model_*_ptm_seed_*.raw.txt")')
+    parser.add_argument('--cmap', type=str, default='bwr', help='Color map for the heatmap (default: bwr)')
+    parser.add_argument('--Alength', type=int, help='Alength value for calculating average values')
+    parser.add_argument('--cache', action='store_true', help='Cache the combined PAE matrix as .pae.npy next to each input file')
+
+    args = parser.parse_args()
+    
+    image_file_names = []
+
+    # Get the list of input files matching the specified pattern
+    input_files = glob.glob(args.file_pattern)
+
+    
+    # Check if there are any matching files
+    if not input_files:
+        print("No matching input files found.")
+        exit(1)
+
+    # Sort the list of input files by rank number
+    input_files = sorted(input_files, key=lambda x: int(re.search(r'rank_(\d+)_', x).group(1)))
+
+    if args.Alength is None:
+        # Read the fasta file and calculate the Alength
+        fasta_file_path = os.path.join(os.path.dirname(args.file_pattern), "fasta.txt")
+        if os.path.exists(fasta_file_path):
+            with open(fasta_file_path, "r") as f:
+                content = f.read()
+                sequences = content.split(">")[1:]
+                first_sequence = sequences[0].split("\n", 1)[1].replace("\n", "")
+                args.Alength = len(first_sequence)
+
+    metrics_df = pd.DataFrame(columns=["rank", "avg_pae_ij", "avg_pae_ji", "Sum_pcbcb_divA", "Sum_pcbcb_divB"])
+
+    for file_path in input_files:
+        # Get the output prefix based on input file name
+        rank_number = int(re.search(r'rank_(\d+)_', file_path).group(1))
+        output_prefix = f"rank_{rank_number:04d}"
+
+        metrics = draw_heatmap(file_path, args.cmap, output_prefix, args.Alength, args.cache)
+        metrics_df = pd.concat([metrics_df, pd.DataFrame([metrics])], ignore_index=True)
+
+        suffix_i = metrics['suffix_i']
+        suffix_j = metrics['suffix_j']
+
+        image_file_names.extend([
+            f"rank_{rank_number:04d}_i_sum_bar_{suffix_i}.png",
+            f"rank_{rank_number:04d}_j_sum_bar_{suffix_j}.png",
+            f"{output_prefix}_2D_heatmap.png",
+        ])
+
+    # Sort the image filenames by rank
+    sorted_image_file_names = sorted(image_file_names, key=lambda x: int(re.search(r'rank_(\d+)_', x).group(1)))
+
+    # Render the template with the metrics dataframe and sorted image filenames
+    output_html = template.render(metrics_df=metrics_df.to_html(classes='data', index=False),
+                                  img_filenames=sorted_image_file_names)
+
+        
+    # Sort the DataFrame by rank
+    metrics_df.sort_values("rank", inplace=True)
+
+    # Create a figure and the first axis (left Y axis)
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    # Plot the metrics on the first axis (left Y axis)
+    ax1.plot(metrics_df["rank"], metrics_df["avg_pae_ij"], label="Average pae_ij")
+    ax1.plot(metrics_df["rank"], metrics_df["avg_pae_ji"], label="Average pae_ji")
+
+    # Set limits and labels for the first axis (left Y axis)
+    ax1.set_ylim(0, 31)
+    ax1.set_xlabel("Rank")
+    ax1.set_ylabel("Average pae")
+    ax1.legend(loc="upper left")
+
+    # Create the second axis (right Y axis) with a shared X axis
+    ax2 = ax1.twinx()
+
+    # Plot the metrics on the second axis (right Y axis)
+    ax2.plot(metrics_df["rank"], metrics_df["Sum_pcbcb_divA"], label="Sum p(cbcb<8) / A chain length", linestyle="--", color="tab:purple")
+    ax2.plot(metrics_df["rank"], metrics_df["Sum_pcbcb_divB"], label="Sum p(cbcb<8) / B chain length", linestyle="--", color="tab:green")
+
+    # Set limits and labels for the second axis (right Y axis)
+    ax2.set_ylim(0, 1)
+    ax2.set_ylabel("Sum p(cbcb<8)")
+    ax2.legend(loc="upper right")
+
+    # Set the title for the plot
+    plt.title("Metrics by Rank")
+
+    # Save the plot to a file
+    metrics_by_rank_filename = f"metrics_by_rank.png"
+    plt.savefig(metrics_by_rank_filename)
+    image_file_names.append(metrics_by_rank_filename)
+
+    create_template_directory_and_file()
+
+    # Jinja2 template loader and environment setup
+    template_loader = FileSystemLoader(searchpath="./templates/")
+    template_env = Environment(loader=template_loader)
+
+    # Load the HTML template
+    template = template_env.get_template("output_template.html")
+
+    # Create a dictionary with the data to be inserted into the template
+    data = {
+        "metrics_df": metrics_df.to_html(),
+        "img_filenames": image_file_names,
+    }
+
+    # Render the HTML file with the data
+    html_output = template.render(data)
+
+    # Write the rendered HTML to a file
+    with open("output.html", "w") as f:
+        f.write(html_output)
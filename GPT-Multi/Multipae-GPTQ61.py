@@ -0,0 +1,1053 @@
+import argparse
+import pandas as pd
+import seaborn as sns
+import matplotlib.pyplot as plt
+import os
+import re
+import glob
+import json
+import sqlite3
+import numpy as np
+import warnings
+import multiprocessing
+from jinja2 import Environment, FileSystemLoader
+from pae_matrix_bundle import BUNDLE_FILE, save_matrix_bundle, list_bundle
+
+metrics_df = pd.DataFrame()
+image_file_names = []
+
+# 複数のジョブの結果をまとめるSQLiteのテーブル（ジョブのディレクトリとrankで1行）
+DATABASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    job_dir TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    model_number INTEGER,
+    input_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    setting_mtime REAL,
+    Alength INTEGER,
+    avg_pae_ij REAL,
+    avg_pae_ji REAL,
+    Sum_pcbcb_divA REAL,
+    Sum_pcbcb_divB REAL,
+    pTMscore REAL,
+    pLDDT REAL,
+    tol REAL,
+    PRIMARY KEY (job_dir, rank)
+);
+CREATE INDEX IF NOT EXISTS models_avg_pae_ij ON models (avg_pae_ij);
+CREATE INDEX IF NOT EXISTS models_avg_pae_ji ON models (avg_pae_ji);
+CREATE INDEX IF NOT EXISTS models_Sum_pcbcb_divA ON models (Sum_pcbcb_divA);
+CREATE INDEX IF NOT EXISTS models_Sum_pcbcb_divB ON models (Sum_pcbcb_divB);
+CREATE INDEX IF NOT EXISTS models_pTMscore ON models (pTMscore);
+CREATE INDEX IF NOT EXISTS models_pLDDT ON models (pLDDT);
+"""
+
+DATABASE_COLUMNS = ["job_dir", "rank", "model_number", "input_path", "size", "mtime", "setting_mtime", "Alength",
+                    "avg_pae_ij", "avg_pae_ji", "Sum_pcbcb_divA", "Sum_pcbcb_divB", "pTMscore", "pLDDT", "tol"]
+
+# --matrix-storeで選べる、メモリマップしたPAE行列ファイルの型
+MATRIX_STORE_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+# npzにまとめる前にrankごとの行列を書いておく一時ファイルの接尾辞
+BUNDLE_PART_SUFFIX = "_combined_heatmap.bundle_part.npy"
+
+# 処理済みのrankを記録するマニフェストファイル
+MANIFEST_FILE = "multipae_manifest.json"
+
+# metricsの表の列（先頭の5列はレポートの表示順、残りは出力ファイル名を作るための列）
+METRICS_COLUMNS = ["rank", "avg_pae_ij", "avg_pae_ji", "Sum_pcbcb_divA", "Sum_pcbcb_divB", "output_prefix", "suffix_i", "suffix_j"]
+
+# .setting.txtからrank、モデル番号、pTMscore、tol、pLDDTを読み込む関数
+# pae-GPTQ44_multi.pyの版はtol/pLDDTの行でモデル番号を取り出しておらず、tolをモデル番号と比べていたため、
+# モデル番号もパターンに含めて比べます。見つからない値はNoneのままにします。
+def parse_setting_file(file_path):
+    with open(file_path, 'r') as file:
+        content = file.read()
+
+    metrics = {
+        'rank': None,
+        'model_number': None,
+        'pTMscore': None,
+        'tol': None,
+        'pLDDT': None,
+    }
+
+    pattern = r'rank_(\d+)_model_(\d+)_ptm_seed_\d+ (?:pLDDT:\d+\.\d+ )?pTMscore:(\d+\.\d+)'
+    match = re.search(pattern, content)
+    if match is None:
+        return metrics
+    metrics['rank'] = int(match.group(1))
+    metrics['model_number'] = int(match.group(2))
+    metrics['pTMscore'] = float(match.group(3))
+
+    pattern = r'model_(\d+)_ptm_seed_\d+ recycles:\d+ tol:(\d+\.\d+) pLDDT:(\d+\.\d+) pTMscore:(\d+\.\d+)'
+    for match in re.finditer(pattern, content):
+        if int(match.group(1)) == metrics['model_number']:
+            metrics['tol'] = float(match.group(2))
+            metrics['pLDDT'] = float(match.group(3))
+            break
+
+    return metrics
+
+# fasta.txtの最初の配列の長さをAlengthとして返す関数（fasta.txtがない場合はNone）
+def read_alength(directory):
+    fasta_file_path = os.path.join(directory, "fasta.txt")
+    if not os.path.exists(fasta_file_path):
+        return None
+    with open(fasta_file_path, "r") as f:
+        content = f.read()
+        sequences = content.split(">")[1:]
+        first_sequence = sequences[0].split("\n", 1)[1].replace("\n", "")
+        return len(first_sequence)
+
+# 鎖間の行の和と件数から、draw_heatmapと同じ式・同じ丸めで指標を計算する関数
+def interface_metrics_from_sums(sum_pae_ij, count_pae_ij, sum_pae_ji, count_pae_ji, sum_p_cbcb, maxi, Alength):
+    return {
+        "avg_pae_ij": round(sum_pae_ij / count_pae_ij, 3) if count_pae_ij else np.nan,
+        "avg_pae_ji": round(sum_pae_ji / count_pae_ji, 3) if count_pae_ji else np.nan,
+        "Sum_pcbcb_divA": round(sum_p_cbcb / Alength, 3),
+        "Sum_pcbcb_divB": round(sum_p_cbcb / (maxi - Alength), 3),
+    }
+
+# .raw.txtをchunksize行ずつ読み、i <= Alength < j の行だけから鎖間の指標とi・jごとのp(cbcb<8)の和を計算する関数
+# 表全体を読み込まないため、使うメモリはchunksizeと残基数で決まります。
+# chainsを渡すと、同じ読み込みで鎖の組ごとのブロックの和も集計し、chain_pair_summaryの表を返します。
+def stream_interface_metrics(file_path, Alength, chunksize=100000, chains=None):
+    boundaries = chain_boundaries([length for _, length in chains]) if chains else None
+    chain_sums = None
+    sums = dict.fromkeys(['pae_ij', 'pae_ji', 'p(cbcb<8)'], 0.0)
+    counts = dict.fromkeys(['pae_ij', 'pae_ji'], 0)
+    max_i = None
+    i_sum_values = pd.Series(dtype=float)
+    j_sum_values = pd.Series(dtype=float)
+
+    for chunk in pd.read_csv(file_path, delimiter='\t', usecols=['i', 'j', 'pae_ij', 'pae_ji', 'p(cbcb<8)'], chunksize=chunksize):
+        chunk_max_i = chunk['i'].max()
+        max_i = chunk_max_i if max_i is None else max(max_i, chunk_max_i)
+
+        if boundaries is not None:
+            chunk_sums = chain_pair_sums(chunk['i'].to_numpy(), chunk['j'].to_numpy(), chunk['pae_ij'].to_numpy(), chunk['pae_ji'].to_numpy(), chunk['p(cbcb<8)'].to_numpy(), boundaries)
+            chain_sums = chunk_sums if chain_sums is None else {key: chain_sums[key] + chunk_sums[key] for key in chain_sums}
+
+        interface = chunk[(chunk['i'] <= Alength) & (chunk['j'] > Alength)]
+        if interface.empty:
+            continue
+        for column in sums:
+            sums[column] += interface[column].sum()
+        for column in counts:
+            counts[column] += interface[column].count()
+        i_sum_values = i_sum_values.add(interface.groupby('i')['p(cbcb<8)'].sum(), fill_value=0)
+        j_sum_values = j_sum_values.add(interface.groupby('j')['p(cbcb<8)'].sum(), fill_value=0)
+
+    maxi = max_i + 1
+    metrics = interface_metrics_from_sums(sums['pae_ij'], counts['pae_ij'], sums['pae_ji'], counts['pae_ji'], sums['p(cbcb<8)'], maxi, Alength)
+
+    # groupbyと同じく、残基番号の順に並べ、インデックスを整数にします。
+    i_sum_values = i_sum_values.sort_index().rename_axis('i').rename('p(cbcb<8)')
+    j_sum_values = j_sum_values.sort_index().rename_axis('j').rename('p(cbcb<8)')
+    i_sum_values.index = i_sum_values.index.astype(int)
+    j_sum_values.index = j_sum_values.index.astype(int)
+
+    chain_pairs = chain_pair_summary(chain_sums, chains) if chain_sums is not None else None
+
+    return metrics, i_sum_values, j_sum_values, maxi, chain_pairs
+
+# fasta.txtのすべての配列を鎖とみなし、(鎖の名前, 長さ)のリストを返す関数（fasta.txtがない場合は空のリスト）
+# ColabFoldの入力のように1つの配列を":"で区切った複合体は、区切りごとに別の鎖とします。
+# 鎖の組の表で行が重複しないように、同じ名前が2回目以降に現れた場合は"_<n>"を付けて区別します。
+def read_chains(directory):
+    fasta_file_path = os.path.join(directory, "fasta.txt")
+    if not os.path.exists(fasta_file_path):
+        return []
+    with open(fasta_file_path, "r") as f:
+        content = f.read()
+
+    chains = []
+    used_names = set()
+    for record in content.split(">")[1:]:
+        header, _, sequence = record.partition("\n")
+        name = header.split()[0] if header.split() else f"chain{len(chains) + 1}"
+        parts = sequence.replace("\n", "").split(":")
+        for index, part in enumerate(parts):
+            chain_name = name if len(parts) == 1 else f"{name}_{index + 1}"
+            unique_name = chain_name
+            count = 1
+            while unique_name in used_names:
+                count += 1
+                unique_name = f"{chain_name}_{count}"
+            used_names.add(unique_name)
+            chains.append((unique_name, len(part)))
+    return chains
+
+# 鎖の長さから、各鎖の先頭の残基位置（0始まり）と末尾を並べた境界の配列を作る関数
+def chain_boundaries(chain_lengths):
+    return np.concatenate(([0], np.cumsum(chain_lengths))).astype(np.int64)
+
+# i, jの各行を鎖の組(ブロック)に振り分け、ブロックごとのPAEの和と件数、p(cbcb<8)の和を一度に集計する関数
+# pae_ijは(iの鎖, jの鎖)、pae_jiは(jの鎖, iの鎖)のブロックに入れ、p(cbcb<8)は(iの鎖, jの鎖)に入れます。
+# 戻り値は鎖数N×Nを1次元にした配列の辞書で、ファイルを分割して読む場合はチャンクごとの値を足し合わせます。
+def chain_pair_sums(i_values, j_values, pae_ij, pae_ji, p_cbcb, boundaries):
+    chain_count = len(boundaries) - 1
+    chain_i = np.searchsorted(boundaries, np.asarray(i_values) - 1, side='right') - 1
+    chain_j = np.searchsorted(boundaries, np.asarray(j_values) - 1, side='right') - 1
+
+    # fasta.txtの長さの範囲外にある残基は集計しません。
+    inside = (chain_i >= 0) & (chain_i < chain_count) & (chain_j >= 0) & (chain_j < chain_count)
+    forward = chain_i[inside] * chain_count + chain_j[inside]
+    backward = chain_j[inside] * chain_count + chain_i[inside]
+
+    bins = chain_count * chain_count
+    pae_ij = np.asarray(pae_ij, dtype=float)[inside]
+    pae_ji = np.asarray(pae_ji, dtype=float)[inside]
+    p_cbcb = np.asarray(p_cbcb, dtype=float)[inside]
+
+    return {
+        "pae_sum": np.bincount(forward, weights=np.nan_to_num(pae_ij), minlength=bins) + np.bincount(backward, weights=np.nan_to_num(pae_ji), minlength=bins),
+        "pae_count": np.bincount(forward, weights=~np.isnan(pae_ij), minlength=bins) + np.bincount(backward, weights=~np.isnan(pae_ji), minlength=bins),
+        "p_cbcb_sum": np.bincount(forward, weights=np.nan_to_num(p_cbcb), minlength=bins),
+    }
+
+# ブロックごとの和から、鎖の組ごとの平均PAEとp(cbcb<8)の和の表（N×N個の行）を作る関数
+# avg_paeは行の鎖の残基から列の鎖の残基への向き、sum_pcbcbは向きによらない値です。
+def chain_pair_summary(sums, chains):
+    chain_count = len(chains)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_pae = (sums["pae_sum"] / sums["pae_count"]).reshape(chain_count, chain_count)
+    p_cbcb_sum = sums["p_cbcb_sum"].reshape(chain_count, chain_count)
+    p_cbcb_sum = p_cbcb_sum + p_cbcb_sum.T - np.diag(np.diag(p_cbcb_sum))
+
+    records = []
+    for a, (name_a, length_a) in enumerate(chains):
+        for b, (name_b, length_b) in enumerate(chains):
+            records.append({
+                "chain_a": name_a,
+                "chain_b": name_b,
+                "length_a": length_a,
+                "length_b": length_b,
+                "avg_pae": None if np.isnan(avg_pae[a, b]) else round(float(avg_pae[a, b]), 3),
+                "sum_pcbcb": round(float(p_cbcb_sum[a, b]), 3),
+                "sum_pcbcb_div_a": round(float(p_cbcb_sum[a, b]) / length_a, 3) if length_a else None,
+                "sum_pcbcb_div_b": round(float(p_cbcb_sum[a, b]) / length_b, 3) if length_b else None,
+            })
+    return records
+
+# ヒートマップを描かずに、Alengthで分けた鎖間の指標だけを計算する関数
+def compute_interface_metrics(file_path, Alength, chunksize=100000):
+    metrics, _, _, _, _ = stream_interface_metrics(file_path, Alength, chunksize)
+    return metrics
+
+# i, j, pae_ij, pae_ji の列から、pivotを使わずにL×Lの行列へ直接書き込む関数
+# pivot→fillna→reindex→addと同じ値になるように、片方の向きにしか値がない行・列はNaNにします。
+def build_pae_matrix(i_values, j_values, pae_ij, pae_ji):
+    max_i = int(i_values.max())
+    max_j = int(j_values.max())
+    size = max(max_i, max_j)  # 行列の大きさ（1からsizeまで）
+    shared = min(max_i, max_j)  # 両方の向きの値がそろう範囲
+
+    # インデックス0以下はreindex(1から)で落ちるため使いません。
+    valid = (i_values >= 1) & (j_values >= 1)
+    rows = i_values[valid] - 1
+    columns = j_values[valid] - 1
+
+    matrix_ij = np.zeros((max_i, max_j))
+    matrix_ij[rows, columns] = np.nan_to_num(pae_ij[valid], nan=0.0)
+    matrix_ji = np.zeros((max_j, max_i))
+    matrix_ji[columns, rows] = np.nan_to_num(pae_ji[valid], nan=0.0)
+
+    combined_matrix = np.full((size, size), np.nan)
+    combined_matrix[:shared, :shared] = matrix_ij[:shared, :shared] + matrix_ji[:shared, :shared]
+
+    return combined_matrix
+
+# build_pae_matrixと同じ値を、作業用の行列を作らずに既存の配列（メモリマップしたファイルなど）へ直接書き込む関数
+# 両方の向きの値がそろう範囲だけを0で初期化し、pae_ijとpae_jiを順に足します（欠けている値は0として扱います）。
+def fill_pae_matrix(out, i_values, j_values, pae_ij, pae_ji):
+    shared = min(int(i_values.max()), int(j_values.max()))
+
+    valid = (i_values >= 1) & (j_values >= 1) & (i_values <= shared) & (j_values <= shared)
+    rows = i_values[valid] - 1
+    columns = j_values[valid] - 1
+
+    out[...] = np.nan
+    out[:shared, :shared] = 0
+    out[rows, columns] += np.nan_to_num(pae_ij[valid], nan=0.0).astype(out.dtype)
+    out[columns, rows] += np.nan_to_num(pae_ji[valid], nan=0.0).astype(out.dtype)
+    return out
+
+# PAE行列をfloat32/float16の.npyファイルとして1回だけ書き出し、読み取り専用のメモリマップとして返す関数
+# 行列は必要な部分だけがディスクから読まれるため、L×Lのfloat64の行列を何枚もメモリに持たずに済みます。
+# use_cacheがTrueなら、入力より新しいファイルをそのまま開きます。
+def store_pae_matrix(file_path, df, store_path, dtype='float32', use_cache=False):
+    if use_cache and os.path.exists(store_path) and os.path.getmtime(store_path) >= os.path.getmtime(file_path):
+        return load_pae_store(store_path)
+
+    i_values = df['i'].to_numpy()
+    j_values = df['j'].to_numpy()
+    size = max(int(i_values.max()), int(j_values.max()))
+
+    matrix = np.lib.format.open_memmap(store_path, mode='w+', dtype=MATRIX_STORE_DTYPES[dtype], shape=(size, size))
+    fill_pae_matrix(matrix, i_values, j_values, df['pae_ij'].to_numpy(dtype=float), df['pae_ji'].to_numpy(dtype=float))
+    matrix.flush()
+    del matrix
+
+    return load_pae_store(store_path)
+
+# store_pae_matrixで保存したPAE行列を読み取り専用のメモリマップとして開く関数
+def load_pae_store(store_path):
+    return np.load(store_path, mmap_mode='r')
+
+# .raw.txtからPAE行列を読み込む関数（use_cacheがTrueなら.npyに保存し、次回は入力より新しい.npyを使います）
+def load_pae_matrix(file_path, df=None, use_cache=False):
+    cache_path = re.sub(r'\.raw\.txt$', '', file_path) + '.pae.npy'
+    if use_cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        return np.load(cache_path)
+
+    if df is None:
+        df = pd.read_csv(file_path, delimiter='\t', usecols=['i', 'j', 'pae_ij', 'pae_ji'])
+
+    combined_matrix = build_pae_matrix(df['i'].to_numpy(), df['j'].to_numpy(), df['pae_ij'].to_numpy(dtype=float), df['pae_ji'].to_numpy(dtype=float))
+
+    if use_cache:
+        np.save(cache_path, combined_matrix)
+
+    return combined_matrix
+
+# PAE行列を1枚のラスター画像としてヒートマップを描画する関数
+# seabornのheatmapと同じく、セル(k, k+1)の範囲に1残基を置き、上から1行目になるようにします。
+# boundariesを渡すと、Alength以外の鎖の境界にも線を引きます。
+def render_heatmap_image(combined_matrix, output_image, cmap='bwr', Alength=None, boundaries=None):
+    size = combined_matrix.shape[0]
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    image = ax.imshow(combined_matrix, cmap=cmap, vmin=0, vmax=31, interpolation='nearest', extent=(0, size, size, 0))
+    fig.colorbar(image, ax=ax)
+
+    # 残基番号の目盛りをセルの中央に表示します。
+    tick_step = max(1, size // 30)
+    ticks = np.arange(0, size, tick_step)
+    ax.set_xticks(ticks + 0.5)
+    ax.set_xticklabels(ticks + 1, rotation=90)
+    ax.set_yticks(ticks + 0.5)
+    ax.set_yticklabels(ticks + 1)
+
+    if Alength is not None:
+        ax.axhline(y=Alength, color='black', linewidth=1)  # Add a horizontal line at the Alength
+        ax.axvline(x=Alength, color='black', linewidth=1)  # Add a vertical line at the Alength
+    if boundaries is not None:
+        for boundary in boundaries[1:-1]:
+            if boundary != Alength and boundary < size:
+                ax.axhline(y=boundary, color='black', linewidth=1)
+                ax.axvline(x=boundary, color='black', linewidth=1)
+    ax.set_title('2D Heatmap of pae_ij')
+    fig.savefig(output_image)
+    plt.close(fig)
+
+# HTMLレポート用に、PAE行列を縮小してカラーマップから直接ピクセルに変換する関数
+def save_heatmap_thumbnail(combined_matrix, output_image, cmap='bwr', Alength=None, thumbnail_size=256):
+    size = combined_matrix.shape[0]
+    factor = max(1, int(np.ceil(size / thumbnail_size)))
+    blocks = int(np.ceil(size / factor))
+
+    # factor×factorのブロックごとに平均します（端の足りない部分はNaNで埋めます）。
+    # メモリマップした行列でも全体を読み込まないように、factor行ずつ処理します。
+    thumbnail = np.empty((blocks, blocks))
+    band = np.full((factor, blocks * factor), np.nan)
+    for block_row in range(blocks):
+        rows = combined_matrix[block_row * factor:(block_row + 1) * factor]
+        band[:] = np.nan
+        band[:len(rows), :size] = rows
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)  # すべてNaNのブロックの警告を無視します
+            thumbnail[block_row] = np.nanmean(band.reshape(factor, blocks, factor), axis=(0, 2))
+
+    pixels = plt.get_cmap(cmap)(np.clip(thumbnail / 31, 0, 1))
+    pixels[np.isnan(thumbnail)] = (1, 1, 1, 1)  # 値のないセルは白にします
+
+    if Alength is not None and 0 < Alength < size:
+        line = min(Alength // factor, blocks - 1)
+        pixels[line, :] = (0, 0, 0, 1)
+        pixels[:, line] = (0, 0, 0, 1)
+
+    plt.imsave(output_image, pixels)
+
+# i・jごとのp(cbcb<8)の和を棒グラフに描画する関数
+def draw_sum_bar_charts(i_mean_values, j_mean_values, output_prefix, suffix_i, suffix_j):
+    plt.figure(figsize=(10, 6))
+    i_mean_values.plot(kind='bar')
+    plt.xlabel('i')
+    plt.ylabel('Sum p(cbcb<8)')
+    plt.title('Sum p(cbcb<8) for i <= Alength and j > Alength (Grouped by i)')
+    plt.xticks(range(0, len(i_mean_values), 10), i_mean_values.index[::10])
+    plt.savefig(f'{output_prefix}_i_sum_bar_{suffix_i}.png')
+
+    plt.figure(figsize=(10, 6))
+    j_mean_values.plot(kind='bar')
+    plt.xlabel('j')
+    plt.ylabel('Sum p(cbcb<8)')
+    plt.title('Sum p(cbcb<8) for i <= Alength and j > Alength (Grouped by j)')
+    plt.xticks(range(0, len(j_mean_values), 10), j_mean_values.index[::10])
+    plt.savefig(f'{output_prefix}_j_sum_bar_{suffix_j}.png')
+
+# ヒートマップを作らずに、ファイルを分割して読みながら鎖間の指標と棒グラフだけを作る関数
+def draw_metrics_only(file_path, output_prefix, Alength, rank_number, chunksize=100000, chains=None):
+    metrics, i_mean_values, j_mean_values, maxi, chain_pairs = stream_interface_metrics(file_path, Alength, chunksize, chains)
+    if chain_pairs is not None:
+        save_chain_pairs(chain_pairs, output_prefix)
+
+    print(f"Average pae_ij for i < {Alength} and j > {Alength}: {metrics['avg_pae_ij']}")
+    print(f"Average pae_ji for i < {Alength} and j > {Alength}: {metrics['avg_pae_ji']}")
+    print(f"Sum_pcbcb_divA for i < {Alength} and j > {Alength}: {metrics['Sum_pcbcb_divA']}")
+    print(f"Sum_pcbcb_divB for i < {Alength} and j > {Alength}: {metrics['Sum_pcbcb_divB']}")
+    print(maxi)
+
+    suffix_i = f"{int(metrics['Sum_pcbcb_divA'] * 100):03d}"
+    suffix_j = f"{int(metrics['Sum_pcbcb_divB'] * 100):03d}"
+    draw_sum_bar_charts(i_mean_values, j_mean_values, output_prefix, suffix_i, suffix_j)
+
+    return {
+        "output_prefix": output_prefix,
+        "rank": rank_number,
+        **metrics,
+        "suffix_i": suffix_i,
+        "suffix_j": suffix_j,
+        "chain_pairs": chain_pairs,
+    }
+
+# 鎖の組ごとの表をrankごとのCSVに保存する関数
+def save_chain_pairs(chain_pairs, output_prefix):
+    pd.DataFrame(chain_pairs).to_csv(f"{output_prefix}_chain_pairs.csv", index=False)
+    print(f"Chain pair summary saved to {output_prefix}_chain_pairs.csv")
+
+# matrix_formatが'npz'のときは、全rankを1つのファイルにまとめられるように結合PAE行列を.npyファイルに書き、そのパスを返します。
+# 行列そのものは返さないため、プロセス間で受け渡したり、メインプロセスに全rankの行列を溜めたりしません。
+def draw_heatmap(file_path, cmap='bwr', output_prefix=None, Alength=None, use_cache=False, rank_number=None, renderer='raster', thumbnail_size=0, metrics_only=False, chunksize=100000, chains=None, matrix_store=None, matrix_format='npz', bundle_dtype='float16'):
+    # rank番号が渡されない場合はファイル名から取得します。
+    if rank_number is None:
+        rank_number = int(re.search(r'rank_(\d+)_', file_path).group(1))
+
+    # 指標だけが必要な場合は、表全体を読み込まずに計算します。
+    if metrics_only and Alength is not None:
+        return draw_metrics_only(file_path, output_prefix, Alength, rank_number, chunksize, chains)
+
+    chain_pairs = None
+    combined_matrix = None
+    matrix_path = None
+    boundaries = chain_boundaries([length for _, length in chains]) if chains else None
+
+    try:
+        # テキストファイルからデータをデータフレームに読み込みます。
+        # 行列をファイルに保存する場合は、メモリを抑えるため使う列だけを読み込みます。
+        if matrix_store:
+            df = pd.read_csv(file_path, delimiter='\t', usecols=['i', 'j', 'pae_ij', 'pae_ji', 'p(cbcb<8)'])
+        else:
+            df = pd.read_csv(file_path, delimiter='\t')
+        print("Dataframe loaded:")
+        print(df.head())
+        maxi=df['i'].max()+1
+
+        if Alength is not None:
+            filtered_df = df[(df['i'] <= Alength) & (df['j'] > Alength)]
+            avg_pae_ij = round(filtered_df['pae_ij'].mean(), 3)
+            avg_pae_ji = round(filtered_df['pae_ji'].mean(), 3)
+            sum_p_cbcb = filtered_df['p(cbcb<8)'].sum()
+            Sum_pcbcb_divA = round(sum_p_cbcb / Alength, 3)
+            Sum_pcbcb_divB = round(sum_p_cbcb / (maxi-Alength), 3)
+
+            print(f"Average pae_ij for i < {Alength} and j > {Alength}: {avg_pae_ij}")
+            print(f"Average pae_ji for i < {Alength} and j > {Alength}: {avg_pae_ji}")
+            print(f"Sum_pcbcb_divA for i < {Alength} and j > {Alength}: {Sum_pcbcb_divA}")
+            print(f"Sum_pcbcb_divB for i < {Alength} and j > {Alength}: {Sum_pcbcb_divB}")
+            print(maxi)
+
+            # 鎖間の行は上で1回だけ取り出したfiltered_dfを使います。
+            i_mean_values = filtered_df.groupby('i')['p(cbcb<8)'].sum()
+            j_mean_values = filtered_df.groupby('j')['p(cbcb<8)'].sum()
+
+            suffix_i = f"{int(Sum_pcbcb_divA * 100):03d}"
+            suffix_j = f"{int(Sum_pcbcb_divB * 100):03d}"
+            draw_sum_bar_charts(i_mean_values, j_mean_values, output_prefix, suffix_i, suffix_j)
+
+        # 鎖が2本より多い複合体にも使えるように、すべての鎖の組の指標を1回の集計で求めます。
+        if boundaries is not None:
+            chain_pairs = chain_pair_summary(chain_pair_sums(df['i'].to_numpy(), df['j'].to_numpy(), df['pae_ij'].to_numpy(), df['pae_ji'].to_numpy(), df['p(cbcb<8)'].to_numpy(), boundaries), chains)
+            save_chain_pairs(chain_pairs, output_prefix)
+
+
+        if matrix_store:
+            # 行列はCSVの代わりにメモリマップしたファイルに1回だけ書き、描画では必要な部分だけを読みます。
+            store_path = f"{output_prefix}_combined_heatmap.{matrix_store}.npy"
+            combined_matrix = store_pae_matrix(file_path, df, store_path, matrix_store, use_cache)
+            del df
+            print(f"Combined PAE matrix saved to {store_path}")
+        else:
+            # i, j, pae_ij, pae_jiを1回でL×Lの行列に書き込みます。
+            combined_matrix = load_pae_matrix(file_path, df, use_cache)
+
+        # npzにまとめる行列は、--matrix-storeのファイルがあればそれを使い、なければrankごとの一時ファイルに書きます。
+        if matrix_format == 'npz':
+            if matrix_store:
+                matrix_path = store_path
+            else:
+                part_path = f"{output_prefix}{BUNDLE_PART_SUFFIX}"
+                np.save(part_path, np.asarray(combined_matrix, dtype=MATRIX_STORE_DTYPES[bundle_dtype]))
+                matrix_path = part_path
+
+        # 行列全体を文字列にするCSVは大きく時間もかかるため、--matrix-format csvのときだけ保存します。
+        if matrix_format == 'csv':
+            residue_range = range(1, combined_matrix.shape[0] + 1)
+            combined_heatmap_df = pd.DataFrame(np.asarray(combined_matrix, dtype=float), index=residue_range, columns=residue_range)
+
+            # Save combined heatmap dataframe to CSV
+            combined_heatmap_df.to_csv(f"{output_prefix}_combined_heatmap.csv")
+            print(f"Combined heatmap dataframe saved to {output_prefix}_combined_heatmap.csv")
+
+            print("Adjusted heatmap dataframe:")
+            print(combined_heatmap_df.head())
+
+        # ヒートマップを描画します（rasterは行列を1枚の画像として、seabornはセルごとに描画します）。
+        if renderer == 'seaborn':
+            if matrix_format != 'csv':
+                residue_range = range(1, combined_matrix.shape[0] + 1)
+                combined_heatmap_df = pd.DataFrame(np.asarray(combined_matrix, dtype=float), index=residue_range, columns=residue_range)
+            plt.figure(figsize=(10, 8))
+            sns.heatmap(combined_heatmap_df, annot=False, fmt='.3f', cmap=cmap, linewidths=0, square=True, vmin=0, vmax=31)
+            plt.axhline(y=Alength, color='black', linewidth=1)  # Add a horizontal line at the Alength
+            plt.axvline(x=Alength, color='black', linewidth=1)  # Add a vertical line at the Alength
+            plt.title('2D Heatmap of pae_ij')
+            plt.savefig(f"{output_prefix}_2D_heatmap.png")
+        else:
+            render_heatmap_image(combined_matrix, f"{output_prefix}_2D_heatmap.png", cmap, Alength, boundaries)
+
+        # HTMLレポート用の縮小画像を保存します。
+        if thumbnail_size > 0:
+            save_heatmap_thumbnail(combined_matrix, f"{output_prefix}_2D_heatmap_thumb.png", cmap, Alength, thumbnail_size)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+    return {
+        "output_prefix": output_prefix,
+        "rank": rank_number,
+        "avg_pae_ij": avg_pae_ij,
+        "avg_pae_ji": avg_pae_ji,
+        "Sum_pcbcb_divA": Sum_pcbcb_divA,
+        "Sum_pcbcb_divB": Sum_pcbcb_divB,
+        "suffix_i": suffix_i,
+        "suffix_j": suffix_j,
+        "chain_pairs": chain_pairs,
+        "matrix_path": matrix_path,
+    }
+
+
+# rankの出力が最新かどうかを判定するための入力ファイルと設定の情報を返す関数
+def input_signature(file_path, Alength, cmap, renderer, thumbnail_size, metrics_only=False, chains=None, matrix_store=None, matrix_format='npz', bundle_dtype='float16'):
+    stat = os.stat(file_path)
+    return {
+        "input": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "Alength": Alength,
+        "cmap": cmap,
+        "renderer": renderer,
+        "thumbnail": thumbnail_size,
+        "metrics_only": metrics_only,
+        "chains": [list(chain) for chain in chains] if chains else None,
+        "matrix_store": matrix_store,
+        "matrix_format": matrix_format,
+        "bundle_dtype": bundle_dtype if matrix_format == 'npz' else None,
+    }
+
+# 1つのrankで作られる出力ファイルの一覧を返す関数
+# npzの行列は全rankで1つのファイルのため、ここには含めません（rankがファイルに入っているかは呼び出し側で確認します）。
+def rank_output_files(metrics, thumbnail_size=0, metrics_only=False, matrix_store=None, matrix_format='npz'):
+    output_prefix = metrics['output_prefix']
+    output_files = [
+        f"{output_prefix}_i_sum_bar_{metrics['suffix_i']}.png",
+        f"{output_prefix}_j_sum_bar_{metrics['suffix_j']}.png",
+    ]
+    if metrics.get('chain_pairs') is not None:
+        output_files.append(f"{output_prefix}_chain_pairs.csv")
+    if metrics_only:
+        return output_files
+    output_files.append(f"{output_prefix}_2D_heatmap.png")
+    if matrix_store:
+        output_files.append(f"{output_prefix}_combined_heatmap.{matrix_store}.npy")
+    if matrix_format == 'csv':
+        output_files.append(f"{output_prefix}_combined_heatmap.csv")
+    if thumbnail_size > 0:
+        output_files.append(f"{output_prefix}_2D_heatmap_thumb.png")
+    return output_files
+
+# マニフェストを読み込む関数（ないか壊れている場合は空にして、すべてのrankを処理し直します）
+def load_manifest(manifest_path=MANIFEST_FILE):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, manifest_path=MANIFEST_FILE):
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+# マニフェストの記録と入力・設定が一致し、出力ファイルがすべて残っていれば最新とみなす関数
+def is_rank_up_to_date(entry, signature):
+    if entry is None or entry.get("signature") != signature:
+        return False
+    return all(os.path.exists(output_file) for output_file in rank_output_files(entry["metrics"], signature["thumbnail"], signature.get("metrics_only", False), signature.get("matrix_store"), signature.get("matrix_format", 'csv')))
+
+# metricsの表をHTMLにする関数
+# 値ごとに文字列にするため、以前のrankごとに行を追加していた表と同じく、列の桁をそろえずに15.61のように表示します。
+def metrics_to_html(metrics_df, **kwargs):
+    return metrics_df.astype(object).to_html(**kwargs)
+
+# metricsの表をダッシュボードなどから読めるようにCSVとParquetで保存する関数
+# ParquetにはpyarrowかfastparquetがPandasから使える必要があり、ない場合はCSVだけを保存します。
+def export_metrics(metrics_df, output_prefix="metrics"):
+    metrics_df.to_csv(f"{output_prefix}.csv", index=False)
+    print(f"Metrics saved to {output_prefix}.csv")
+
+    try:
+        metrics_df.to_parquet(f"{output_prefix}.parquet", index=False)
+        print(f"Metrics saved to {output_prefix}.parquet")
+    except ImportError as e:
+        print(f"Skipping {output_prefix}.parquet: {e}")
+
+# データベースに登録する1モデル分の行を作る関数（ワーカープロセスで実行できるように引数はタプルで受け取ります）
+# 指標の計算に失敗した場合はNoneを返し、次回の実行で再計算されるように登録しません。
+def collect_model_row(task):
+    job_dir, file_path, rank_number, Alength, stat, chunksize = task
+    setting_file_path = file_path.replace(".raw.txt", ".setting.txt")
+
+    row = dict.fromkeys(DATABASE_COLUMNS)
+    row.update(job_dir=job_dir, rank=rank_number, input_path=file_path, size=stat[0], mtime=stat[1], Alength=Alength)
+
+    if os.path.exists(setting_file_path):
+        row["setting_mtime"] = os.path.getmtime(setting_file_path)
+        setting = parse_setting_file(setting_file_path)
+        row.update(model_number=setting["model_number"], pTMscore=setting["pTMscore"], pLDDT=setting["pLDDT"], tol=setting["tol"])
+
+    try:
+        if Alength is not None:
+            row.update(compute_interface_metrics(file_path, Alength, chunksize))
+    except Exception as e:
+        print(f"An error occurred in {file_path}: {e}")
+        return None
+
+    # SQLiteに渡せるようにnumpyの数値をPythonの数値にし、NaNはNULLにします。
+    for column, value in row.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and np.isnan(value):
+            value = None
+        row[column] = value
+
+    return row
+
+# 複数のジョブディレクトリを走査し、新しいモデルと変更されたモデルだけをSQLiteデータベースに登録する関数
+def update_database(database_path, job_dirs, file_pattern, Alength=None, jobs=1, chunksize=100000):
+    connection = sqlite3.connect(database_path)
+    connection.executescript(DATABASE_SCHEMA)
+
+    known = {(row[0], row[1]): row[2:] for row in connection.execute("SELECT job_dir, rank, input_path, size, mtime, setting_mtime, Alength FROM models")}
+
+    tasks = []
+    skipped = 0
+    removed = []
+    for job_dir in job_dirs:
+        job_dir = os.path.abspath(job_dir)
+        job_Alength = Alength if Alength is not None else read_alength(job_dir)
+        ranks = set()
+
+        for file_path in glob.glob(os.path.join(job_dir, file_pattern)):
+            match = re.search(r'rank_(\d+)_', os.path.basename(file_path))
+            if match is None:
+                continue
+            rank_number = int(match.group(1))
+            ranks.add(rank_number)
+
+            stat = os.stat(file_path)
+            setting_file_path = file_path.replace(".raw.txt", ".setting.txt")
+            setting_mtime = os.path.getmtime(setting_file_path) if os.path.exists(setting_file_path) else None
+            if known.get((job_dir, rank_number)) == (file_path, stat.st_size, stat.st_mtime, setting_mtime, job_Alength):
+                skipped += 1
+                continue
+            tasks.append((job_dir, file_path, rank_number, job_Alength, (stat.st_size, stat.st_mtime), chunksize))
+
+        # 走査したジョブで入力ファイルがなくなったrankは削除します。
+        removed.extend((job_dir, rank_number) for known_dir, rank_number in known if known_dir == job_dir and rank_number not in ranks)
+
+    if jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(jobs, len(tasks))) as pool:
+            rows = pool.map(collect_model_row, tasks)
+    else:
+        rows = [collect_model_row(task) for task in tasks]
+
+    # 計算に失敗したモデルは古い行も削除し、古い指標が残らないようにします。
+    failed = [(task[0], task[2]) for task, row in zip(tasks, rows) if row is None]
+    rows = [row for row in rows if row is not None]
+
+    placeholders = ", ".join("?" for _ in DATABASE_COLUMNS)
+    with connection:
+        connection.executemany(f"INSERT OR REPLACE INTO models ({', '.join(DATABASE_COLUMNS)}) VALUES ({placeholders})",
+                               [[row[column] for column in DATABASE_COLUMNS] for row in rows])
+        connection.executemany("DELETE FROM models WHERE job_dir = ? AND rank = ?", removed + failed)
+    total = connection.execute("SELECT COUNT(*) FROM models").fetchone()[0]
+    connection.close()
+
+    print(f"Database {database_path}: {len(rows)} models updated, {skipped} up to date, {len(failed)} failed, {len(removed)} removed, {total} in total")
+
+# ワーカープロセスで1つのrankを処理する関数（画面のないAggバックエンドで描画します）
+def process_rank(task):
+    plt.switch_backend('Agg')
+    metrics = draw_heatmap(*task)
+    plt.close('all')
+    return metrics
+
+
+def create_template_directory_and_file():
+    # Create the template directory if it does not exist
+    template_directory = 'templates'
+    if not os.path.exists(template_directory):
+        os.makedirs(template_directory)
+
+    # Create the template file
+    template_file = os.path.join(template_directory, 'output_template.html')
+    with open(template_file, 'w') as file:
+        file.write('''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Output</title>
+    <style>
+        table {
+            border-collapse: collapse;
+            width: 100%;
+        }
+        th, td {
+            border: 1px solid black;
+            padding: 8px;
+            text-align: left;
+        }
+        th {
+            background-color: #f2f2f2;
+        }
+        .image-container {
+            display: flex;
+            flex-wrap: wrap;
+        }
+        .image-wrapper {
+            flex: 1;
+        }
+        .image-wrapper img {
+            max-width: 100%;
+            height: auto;
+        }
+        .pae-image {
+            max-width: 20%;
+        }
+        .sum-image {
+            min-width: 50%;
+        }
+    </style>
+</head>
+<body>
+    <h1>Metrics Dataframe</h1>
+    {{ metrics_df | safe }}
+{% if chain_tables %}
+    <h1>Chain Pairs</h1>{% for title, table in chain_tables %}
+    <h2>{{ title }}</h2>
+    {{ table | safe }}{% endfor %}
+{% endif %}
+    <h1>Matrix by Rank</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if img_filename.endswith('metrics_by_rank.png') %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+
+    <h1>PAE</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if img_filename.endswith('_2D_heatmap.png') %}
+        <div class="image-wrapper">{% if thumbnails %}
+            <a href="{{ img_filename }}"><img src="{{ img_filename[:-4] }}_thumb.png" alt="{{ img_filename }}"></a>{% else %}
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">{% endif %}
+        </div>{% endif %}{% endfor %}
+    </div>
+
+    <h1>Other predicted images</h1>
+    <div class="image-container">
+        <div class="image-wrapper">
+            <img src="msa_coverage.png">
+        </div>
+        <div class="image-wrapper">
+            <img src="predicted_LDDT.png">
+        </div>
+    </div>
+
+    <h1>Sum p(cbcb<8)</h1>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if '_i_sum_bar_' in img_filename %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+    <div class="image-container">{% for img_filename in img_filenames %}{% if '_j_sum_bar_' in img_filename %}
+        <div class="image-wrapper">
+            <img src="{{ img_filename }}" alt="{{ img_filename }}">
+        </div>{% endif %}{% endfor %}
+    </div>
+</body>
+</html>
+''')
+        
+    return template_directory, template_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Draw a 2D heatmap from a text file.')
+    parser.add_argument('file_pattern', type=str, nargs='?', default="rank_*_model_*_ptm_seed_*.raw.txt", help='File pattern to match input text files (e.g., "rank_*_model_*_ptm_seed_*.raw.txt")')
+    parser.add_argument('--cmap', type=str, default='bwr', help='Color map for the heatmap (default: bwr)')
+    parser.add_argument('--Alength', type=int, help='Alength value for calculating average values')
+    parser.add_argument('--cache', action='store_true', help='Cache the combined PAE matrix as .pae.npy next to each input file')
+    parser.add_argument('--renderer', type=str, choices=['raster', 'seaborn'], default='raster', help='Heatmap rendering: raster draws the matrix as one image, seaborn draws each cell (default: raster)')
+    parser.add_argument('--thumbnail', type=int, default=0, help='Also save downsampled heatmap thumbnails of this size in pixels and use them in output.html (default: off)')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker processes for rendering ranks in parallel (default: 1)')
+    parser.add_argument('--force', action='store_true', help=f'Reprocess every rank even if {MANIFEST_FILE} says its outputs are up to date')
+    parser.add_argument('--matrix-store', type=str, choices=sorted(MATRIX_STORE_DTYPES), default=None, help='Write the combined PAE matrix as a memory-mapped <prefix>_combined_heatmap.<dtype>.npy instead of the CSV and draw from it (default: CSV)')
+    parser.add_argument('--matrix-format', type=str, choices=['npz', 'csv', 'none'], default='npz', help=f'Combined PAE matrix output: npz stores every rank in one compressed {BUNDLE_FILE} (read it with pae_matrix_bundle.py), csv writes <prefix>_combined_heatmap.csv per rank as before (default: npz)')
+    parser.add_argument('--bundle-dtype', type=str, choices=sorted(MATRIX_STORE_DTYPES), default='float16', help=f'Value type in {BUNDLE_FILE} (default: float16)')
+    parser.add_argument('--chain-lengths', type=int, nargs='+', default=None, help='Chain lengths in residue order for the chain pair summary (default: every sequence in fasta.txt)')
+    parser.add_argument('--metrics-only', action='store_true', help='Compute the interface metrics and bar charts by streaming the input in chunks, without heatmaps or combined CSVs (requires Alength)')
+    parser.add_argument('--chunksize', type=int, default=100000, help='Rows read at a time by --metrics-only and --database (default: 100000)')
+    parser.add_argument('--database', type=str, default=None, help='Collect metrics of every job directory given by --job-dirs into this SQLite database instead of drawing a report')
+    parser.add_argument('--job-dirs', type=str, nargs='+', default=[], help='Job directories or glob patterns to scan in --database mode (file_pattern is matched inside each directory)')
+
+    args = parser.parse_args()
+
+    # データベースモードでは、ヒートマップやレポートは作らずに各ジョブの指標だけを集めます。
+    if args.database:
+        job_dirs = sorted({path for pattern in args.job_dirs for path in glob.glob(pattern) if os.path.isdir(path)})
+        if not job_dirs:
+            print("No job directories found.")
+            exit(1)
+        update_database(args.database, job_dirs, args.file_pattern, args.Alength, args.jobs, args.chunksize)
+        exit(0)
+
+    # テンプレートとoutput.htmlはレポートを作る場合だけ用意し、データベースモードでは既存のoutput.htmlを上書きしません。
+    # Call the function to create the template directory and file
+    template_directory, template_file = create_template_directory_and_file()
+
+    # Set up the Jinja2 environment
+    env = Environment(loader=FileSystemLoader(template_directory))
+    template = env.get_template(os.path.basename(template_file))
+
+    # Render the template with the metrics dataframe and image filenames
+    output_html = template.render(metrics_df=metrics_to_html(metrics_df, classes='data', index=False),
+                                  img_filenames=sorted(image_file_names))
+
+    # Save the rendered HTML to a file
+    with open('output.html', 'w') as file:
+        file.write(output_html)
+    
+    image_file_names = []
+
+    # Get the list of input files matching the specified pattern
+    input_files = glob.glob(args.file_pattern)
+
+    
+    # Check if there are any matching files
+    if not input_files:
+        print("No matching input files found.")
+        exit(1)
+
+    # Sort the list of input files by rank number
+    input_files = sorted(input_files, key=lambda x: int(re.search(r'rank_(\d+)_', x).group(1)))
+
+    if args.Alength is None:
+        # Read the fasta file and calculate the Alength
+        fasta_file_path = os.path.join(os.path.dirname(args.file_pattern), "fasta.txt")
+        if os.path.exists(fasta_file_path):
+            with open(fasta_file_path, "r") as f:
+                content = f.read()
+                sequences = content.split(">")[1:]
+                first_sequence = sequences[0].split("\n", 1)[1].replace("\n", "")
+                args.Alength = len(first_sequence)
+
+    # --metrics-onlyはAlengthで鎖Aと鎖Bを分けて集計するため、Alengthが分からない場合は重い通常の処理に戻らずに終了します。
+    if args.metrics_only and args.Alength is None:
+        print("--metrics-only needs Alength: fasta.txt was not found next to the input files and --Alength was not given.")
+        exit(1)
+
+    # 鎖の組ごとの集計に使う鎖の名前と長さ（鎖が1本以下なら集計しません）
+    if args.chain_lengths:
+        chains = [(chr(ord('A') + index) if index < 26 else f"chain{index + 1}", length) for index, length in enumerate(args.chain_lengths)]
+    else:
+        chains = read_chains(os.path.dirname(args.file_pattern))
+    if len(chains) < 2:
+        chains = None
+
+    # マニフェストと比べて、入力も設定も変わっていないrankは前回のmetricsを使い、新しいrankと変わったrankだけを処理します。
+    manifest = {} if args.force else load_manifest()
+    # npzにまとめる場合は、スキップするrankの行列が前回のファイルに入っている必要があります。
+    use_bundle = args.matrix_format == 'npz' and not args.metrics_only
+    bundle_prefixes = set(list_bundle(BUNDLE_FILE)) if use_bundle else set()
+    new_manifest = {}
+    cached_metrics = {}
+    skipped_prefixes = set()
+    tasks = []
+    signatures = {}
+    for file_path in input_files:
+        # Get the output prefix based on input file name
+        rank_number = int(re.search(r'rank_(\d+)_', file_path).group(1))
+        output_prefix = f"rank_{rank_number:04d}"
+        signature = input_signature(file_path, args.Alength, args.cmap, args.renderer, args.thumbnail, args.metrics_only, chains, args.matrix_store, args.matrix_format, args.bundle_dtype)
+        entry = manifest.get(output_prefix)
+        if is_rank_up_to_date(entry, signature) and (not use_bundle or output_prefix in bundle_prefixes):
+            print(f"Skipping {file_path}: outputs are up to date")
+            cached_metrics[output_prefix] = entry["metrics"]
+            skipped_prefixes.add(output_prefix)
+            new_manifest[output_prefix] = entry
+        else:
+            signatures[output_prefix] = signature
+            tasks.append((file_path, args.cmap, output_prefix, args.Alength, args.cache, rank_number, args.renderer, args.thumbnail, args.metrics_only, args.chunksize, chains, args.matrix_store, args.matrix_format, args.bundle_dtype))
+
+    # rankごとの処理は独立しているため、--jobsが2以上ならプロセスプールで並列に処理します。
+    if args.jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(args.jobs, len(tasks))) as pool:
+            processed = pool.map(process_rank, tasks)
+    else:
+        processed = [draw_heatmap(*task) for task in tasks]
+
+    new_matrix_files = {}
+    for metrics in processed:
+        output_prefix = metrics['output_prefix']
+        matrix_path = metrics.pop('matrix_path', None)
+        if matrix_path is not None:
+            new_matrix_files[output_prefix] = matrix_path
+        cached_metrics[output_prefix] = metrics
+        new_manifest[output_prefix] = {"signature": signatures[output_prefix], "metrics": metrics}
+
+    # 今回の入力にあるrankだけをマニフェストに残します。
+    save_manifest(new_manifest)
+
+    # 処理したrankの行列と、スキップしたrankの前回の行列を1つのnpzファイルに1つずつ書き込みます。
+    # 前回の行列を使うのはマニフェストでスキップしたrankだけで、処理に失敗して行列がないrankはファイルから除きます。
+    # 新しい行列がなく、除くrankもなければ、ファイルは書き直しません。
+    if use_bundle:
+        kept_prefixes = sorted(skipped_prefixes)
+        if new_matrix_files or set(kept_prefixes) != bundle_prefixes:
+            save_matrix_bundle(new_matrix_files, BUNDLE_FILE, MATRIX_STORE_DTYPES[args.bundle_dtype], BUNDLE_FILE, kept_prefixes)
+            print(f"Combined PAE matrices of {len(new_matrix_files) + len(kept_prefixes)} ranks saved to {BUNDLE_FILE}")
+        else:
+            print(f"{BUNDLE_FILE} is up to date")
+
+        # --matrix-storeのファイルは残し、rankごとの一時ファイルだけを削除します。
+        for matrix_path in new_matrix_files.values():
+            if matrix_path.endswith(BUNDLE_PART_SUFFIX):
+                os.remove(matrix_path)
+
+    # 処理したrankとスキップしたrankのmetricsをrank順に並べます。
+    results = sorted(cached_metrics.values(), key=lambda metrics: metrics['rank'])
+
+    # rankごとのmetricsはリストに追加するだけにして、表は最後に1回だけ作ります。
+    metrics_records = []
+    for metrics in results:
+        rank_number = metrics['rank']
+        output_prefix = metrics['output_prefix']
+        metrics_records.append(metrics)
+
+        suffix_i = metrics['suffix_i']
+        suffix_j = metrics['suffix_j']
+
+        image_file_names.extend([
+            f"rank_{rank_number:04d}_i_sum_bar_{suffix_i}.png",
+            f"rank_{rank_number:04d}_j_sum_bar_{suffix_j}.png",
+        ])
+        if not args.metrics_only:
+            image_file_names.append(f"{output_prefix}_2D_heatmap.png")
+
+    metrics_df = pd.DataFrame.from_records(metrics_records, columns=METRICS_COLUMNS)
+    export_metrics(metrics_df)
+
+    # 鎖の組ごとの表は、全rankをまとめたchain_pairs.csvと、rankごとのN×Nの表としてレポートに載せます。
+    chain_records = [{"rank": metrics['rank'], **pair} for metrics in metrics_records for pair in (metrics.get('chain_pairs') or [])]
+    chain_tables = []
+    if chain_records:
+        chain_pairs_df = pd.DataFrame(chain_records)
+        chain_pairs_df.to_csv("chain_pairs.csv", index=False)
+        chain_names = list(dict.fromkeys(chain_pairs_df['chain_a']))
+        for rank_number, rank_df in chain_pairs_df.groupby('rank', sort=True):
+            for column, label in [("avg_pae", "average PAE (row chain to column chain)"), ("sum_pcbcb", "sum p(cbcb<8)")]:
+                table = rank_df.pivot(index='chain_a', columns='chain_b', values=column).reindex(index=chain_names, columns=chain_names)
+                chain_tables.append((f"rank_{rank_number:04d} {label}", table.to_html()))
+
+    # Sort the image filenames by rank
+    sorted_image_file_names = sorted(image_file_names, key=lambda x: int(re.search(r'rank_(\d+)_', x).group(1)))
+
+    # Render the template with the metrics dataframe and sorted image filenames
+    output_html = template.render(metrics_df=metrics_to_html(metrics_df, classes='data', index=False),
+                                  img_filenames=sorted_image_file_names)
+
+        
+    # Sort the DataFrame by rank
+    metrics_df.sort_values("rank", inplace=True)
+
+    # Create a figure and the first axis (left Y axis)
+    fig, ax1 = plt.subplots(figsize=(10, 6))
+
+    # Plot the metrics on the first axis (left Y axis)
+    ax1.plot(metrics_df["rank"], metrics_df["avg_pae_ij"], label="Average pae_ij")
+    ax1.plot(metrics_df["rank"], metrics_df["avg_pae_ji"], label="Average pae_ji")
+
+    # Set limits and labels for the first axis (left Y axis)
+    ax1.set_ylim(0, 31)
+    ax1.set_xlabel("Rank")
+    ax1.set_ylabel("Average pae")
+    ax1.legend(loc="upper left")
+
+    # Create the second axis (right Y axis) with a shared X axis
+    ax2 = ax1.twinx()
+
+    # Plot the metrics on the second axis (right Y axis)
+    ax2.plot(metrics_df["rank"], metrics_df["Sum_pcbcb_divA"], label="Sum p(cbcb<8) / A chain length", linestyle="--", color="tab:purple")
+    ax2.plot(metrics_df["rank"], metrics_df["Sum_pcbcb_divB"], label="Sum p(cbcb<8) / B chain length", linestyle="--", color="tab:green")
+
+    # Set limits and labels for the second axis (right Y axis)
+    ax2.set_ylim(0, 1)
+    ax2.set_ylabel("Sum p(cbcb<8)")
+    ax2.legend(loc="upper right")
+
+    # Set the title for the plot
+    plt.title("Metrics by Rank")
+
+    # Save the plot to a file
+    metrics_by_rank_filename = f"metrics_by_rank.png"
+    plt.savefig(metrics_by_rank_filename)
+    image_file_names.append(metrics_by_rank_filename)
+
+    create_template_directory_and_file()
+
+    # Jinja2 template loader and environment setup
+    template_loader = FileSystemLoader(searchpath="./templates/")
+    template_env = Environment(loader=template_loader)
+
+    # Load the HTML template
+    template = template_env.get_template("output_template.html")
+
+    # Create a dictionary with the data to be inserted into the template
+    data = {
+        "metrics_df": metrics_to_html(metrics_df),
+        "img_filenames": image_file_names,
+        "thumbnails": args.thumbnail > 0,
+        "chain_tables": chain_tables,
+    }
+
+    # Render the HTML file with the data
+    html_output = template.render(data)
+
+    # Write the rendered HTML to a file
+    with open("output.html", "w") as f:
+        f.write(html_output)
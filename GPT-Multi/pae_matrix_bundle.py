@@ -0,0 +1,75 @@
+import os
+import zipfile
+import argparse
+import numpy as np
+import pandas as pd
+
+# 全rankの結合PAE行列をまとめて保存する既定のファイル名
+BUNDLE_FILE = "combined_heatmaps.npz"
+
+# rankごとの行列（キーはrank_0001などの出力プレフィックス）を1つの圧縮.npzファイルに保存する関数
+# matricesの値は行列か、行列を保存した.npyファイルのパスです。rankごとに読み込んで書き込むため、メモリに置くのは1つのrankの行列だけです。
+# keep_fromに前回のファイルを渡すと、keep_prefixesのrankの行列をそこから1つずつ書き写します。
+# 書き込み中に失敗しても前のファイルが壊れないように、一時ファイルに書いてから置き換えます。
+def save_matrix_bundle(matrices, bundle_path=BUNDLE_FILE, dtype=np.float16, keep_from=None, keep_prefixes=()):
+    temporary_path = f"{bundle_path}.tmp.npz"
+    previous = np.load(keep_from) if keep_prefixes else None
+
+    try:
+        # np.savez_compressedと同じく、各行列を"<キー>.npy"としてzipに圧縮して書き込みます。
+        with zipfile.ZipFile(temporary_path, mode="w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as bundle:
+            for output_prefix in sorted(set(matrices) | set(keep_prefixes)):
+                if output_prefix in matrices:
+                    matrix = matrices[output_prefix]
+                    if isinstance(matrix, str):
+                        matrix = np.load(matrix, mmap_mode="r")
+                else:
+                    matrix = previous[output_prefix]
+                with bundle.open(f"{output_prefix}.npy", mode="w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.asarray(matrix, dtype=dtype), allow_pickle=False)
+                del matrix
+    finally:
+        if previous is not None:
+            previous.close()
+
+    os.replace(temporary_path, bundle_path)
+
+# ファイルに入っているrankの出力プレフィックスの一覧を返す関数（ファイルがない場合は空のリスト）
+def list_bundle(bundle_path=BUNDLE_FILE):
+    if not os.path.exists(bundle_path):
+        return []
+    with np.load(bundle_path) as bundle:
+        return sorted(bundle.files)
+
+# 指定したrankの行列を読み込む関数（output_prefixesを省略すると全rank）
+def read_matrices(bundle_path=BUNDLE_FILE, output_prefixes=None, dtype=np.float32):
+    with np.load(bundle_path) as bundle:
+        if output_prefixes is None:
+            output_prefixes = sorted(bundle.files)
+        return {output_prefix: bundle[output_prefix].astype(dtype) for output_prefix in output_prefixes}
+
+# 1つのrankの行列を読み込む関数
+def read_matrix(output_prefix, bundle_path=BUNDLE_FILE, dtype=np.float32):
+    return read_matrices(bundle_path, [output_prefix], dtype)[output_prefix]
+
+# 1つのrankの行列を、_combined_heatmap.csvと同じ1始まりの行・列番号のデータフレームとして読み込む関数
+def read_matrix_df(output_prefix, bundle_path=BUNDLE_FILE):
+    matrix = read_matrix(output_prefix, bundle_path, np.float64)
+    residue_range = range(1, matrix.shape[0] + 1)
+    return pd.DataFrame(matrix, index=residue_range, columns=residue_range)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List or export the combined PAE matrices stored in a Multipae .npz bundle")
+    parser.add_argument("bundle", type=str, nargs="?", default=BUNDLE_FILE, help=f"Bundle file (default: {BUNDLE_FILE})")
+    parser.add_argument("-r", "--rank", type=str, nargs="+", default=None, help="Output prefixes to export (e.g. rank_0001, default: all)")
+    parser.add_argument("--csv", action="store_true", help="Write <prefix>_combined_heatmap.csv for each selected rank")
+
+    args = parser.parse_args()
+
+    output_prefixes = args.rank if args.rank else list_bundle(args.bundle)
+    for output_prefix in output_prefixes:
+        combined_heatmap_df = read_matrix_df(output_prefix, args.bundle)
+        print(f"{output_prefix}: {combined_heatmap_df.shape[0]} x {combined_heatmap_df.shape[1]}")
+        if args.csv:
+            combined_heatmap_df.to_csv(f"{output_prefix}_combined_heatmap.csv")
+            print(f"Combined heatmap dataframe saved to {output_prefix}_combined_heatmap.csv")
@@ -0,0 +1,78 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+# Make the shared PDB decoder (GPT_PDBIO/pdb_decoder.py) importable
+pdbio_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "GPT_PDBIO")
+if pdbio_path not in sys.path:
+    sys.path.append(pdbio_path)
+
+from pdb_decoder import decode_atom_records
+
+# Function to process a PDB file based on specified filters
+def process_pdb_file(input_filename, output_filename, specified_char=None, replace_17th_char=False):
+    # Read the whole input PDB file and decode the ATOM/HETATM columns in one pass
+    with open(input_filename, "rb") as input_file:
+        data = input_file.read()
+
+    # Convert CRLF and CR line endings to LF as text mode does, so the output always uses LF like Q05
+    data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    lines = data.split(b"\n")
+    atoms = decode_atom_records(data, records=("ATOM", "HETATM"))
+    line_index = atoms["line_index"]
+
+    # Every line starting with "ATOM" (e.g. also "ATOMX") follows the altloc filter, as in Q05
+    is_atom = atoms["record"] != "HETATM"
+
+    # The 17th character as Q05 sees it: the newline for 16-character lines, and none (-1) for shorter lines
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))[line_index]
+    ends = np.concatenate((newlines, [len(buffer)]))[line_index]
+    positions = starts + 16
+    inside = positions < ends
+    column_17 = np.full(len(line_index), -1, dtype=np.int64)
+    column_17[inside] = buffer[positions[inside]]
+    column_17[(positions == ends) & (line_index < len(lines) - 1)] = ord("\n")
+
+    # Keep ATOM records with a blank or the specified alternative location ("A" by default), ATOM records shorter than
+    # 17 characters, and all HETATM records
+    alternative_char = "A" if specified_char is None else specified_char
+    accepted = column_17 == ord(" ")
+    if len(alternative_char) == 1:
+        accepted |= column_17 == ord(alternative_char)
+    keep = ~is_atom | (column_17 < 0) | accepted
+    replace = is_atom & accepted & replace_17th_char
+
+    filtered_lines = []
+    for index, replace_line in zip(line_index[keep].tolist(), replace[keep].tolist()):
+        line = lines[index]
+        # Replace the 17th character of ATOM records
+        if replace_line:
+            line = line[:16] + b" " + line[17:]
+        # Restore the newline removed by split (the last line has none)
+        if index < len(lines) - 1:
+            line += b"\n"
+        filtered_lines.append(line)
+
+    # Write the filtered lines to the output PDB file
+    write_pdb(filtered_lines, output_filename)
+
+# Function to write the filtered lines to a PDB file
+def write_pdb(lines, output_filename):
+    with open(output_filename, "wb") as output_file:
+        for line in lines:
+            output_file.write(line)
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a PDB file and apply filters based on the 17th character.")
+    parser.add_argument("input_pdb_file", help="Path to the input PDB file.")
+    parser.add_argument("output_pdb_file", help="Path to the output PDB file.")
+    parser.add_argument("-s", "--specified_char", help="The specified character to filter on.")
+    parser.add_argument("-r", "--replace_17th_char", action="store_true", help="Replace the 17th character with a space.")
+
+    args = parser.parse_args()
+
+    process_pdb_file(args.input_pdb_file, args.output_pdb_file, args.specified_char, args.replace_17th_char)
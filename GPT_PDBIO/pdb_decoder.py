@@ -0,0 +1,219 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+# PDB ATOM/HETATMレコードの固定幅カラム (開始, 終了)、PDBフォーマットの1始まりの列番号から1を引いた値
+COLUMNS = {
+    "record": (0, 6),
+    "serial": (6, 11),
+    "name": (12, 16),
+    "altloc": (16, 17),
+    "resname": (17, 20),
+    "chain": (21, 22),
+    "resseq": (22, 26),
+    "icode": (26, 27),
+    "x": (30, 38),
+    "y": (38, 46),
+    "z": (46, 54),
+    "occupancy": (54, 60),
+    "b_factor": (60, 66),
+}
+
+# 文字列として返すカラム、整数として返すカラム、実数として返すカラム
+STRING_FIELDS = ["record", "name", "altloc", "resname", "chain", "icode"]
+INT_FIELDS = ["serial", "resseq"]
+FLOAT_FIELDS = ["x", "y", "z", "occupancy", "b_factor"]
+
+# デコードする1行の幅（これより後ろの列は使わない）
+LINE_WIDTH = 66
+
+# 文字コード
+SPACE, MINUS, POINT, ZERO = ord(" "), ord("-"), ord("."), ord("0")
+
+# バッファを改行で区切り、各行の開始位置と終了位置（改行・CRを除く）を返す関数
+def _line_bounds(raw):
+    newlines = np.flatnonzero(raw == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(raw)]))
+
+    # CRLFの場合はCRを行に含めない
+    if len(raw):
+        has_cr = (ends > starts) & (raw[np.maximum(ends - 1, 0)] == ord("\r"))
+        ends = ends - has_cr
+
+    return starts, ends
+
+# 指定した行の先頭からwidth文字を(行数×width)の配列として取り出す関数（行末より後ろは空白で埋める）
+# 列ごとに取り出すため、配列はFortran順（列が連続）で作る
+def _gather(raw, starts, ends, width):
+    table = np.full((len(starts), width), SPACE, dtype=np.uint8, order="F")
+    if len(starts) == 0:
+        return table
+
+    full_width = bool(np.all(ends - starts >= width))  # 全行が十分長ければ行末の判定を省く
+    for column in range(width):
+        positions = starts + column
+        if full_width:
+            table[:, column] = raw[positions]
+        else:
+            inside = positions < ends
+            table[inside, column] = raw[positions[inside]]
+
+    return table
+
+# 文字配列から1つのカラムを取り出す関数
+def _column(table, field):
+    start, end = COLUMNS[field]
+    return table[:, start:end]
+
+# ASCIIの文字配列を、前後の空白を除いたUnicode文字列の配列にする関数
+def _to_str(chars):
+    width = chars.shape[1]
+    values = np.ascontiguousarray(chars).view(f"S{width}").ravel()
+    values = np.char.strip(values)
+    # S型からU型へはバイトを4バイト整数に広げるだけで変換できる（ASCIIのみ）
+    stripped = np.ascontiguousarray(values.astype(f"S{width}")).view(np.uint8).reshape(-1, width)
+    return stripped.astype(np.uint32).view(f"U{width}").ravel()
+
+# 右詰めの固定小数点数（全行で小数点の位置が同じ）を一度に解析する関数
+# 戻り値は(整数部と小数部を連結した値の絶対値, 小数点以下の桁数, 負号の有無, 解析できた行のマスク)
+# 解析できない行（空欄・小数点の位置が違う・指数表記など）はマスクがFalseになる
+def _parse_fixed_point(chars):
+    rows, width = chars.shape
+    point_columns = np.flatnonzero(np.all(chars == POINT, axis=0))
+    point = int(point_columns[0]) if len(point_columns) else None
+
+    mantissa = np.zeros(rows, dtype=np.int64)
+    negative = np.zeros(rows, dtype=bool)
+    seen_digit = np.zeros(rows, dtype=bool)
+    valid = np.ones(rows, dtype=bool)
+
+    for column in range(width):
+        if column == point:
+            continue
+        values = chars[:, column]
+        digits = values - np.uint8(ZERO)  # 数字以外は桁あふれして10以上になる
+        is_digit = digits <= 9
+        is_minus = values == MINUS
+        # 数字より前に空白・負号があるのは可、数字の後ろに数字以外があれば解析できない
+        valid &= is_digit | (((values == SPACE) | is_minus) & ~seen_digit)
+        mantissa = mantissa * 10 + np.where(is_digit, digits, 0)
+        negative |= is_minus
+        seen_digit |= is_digit
+
+    valid &= seen_digit
+    fraction_digits = width - point - 1 if point is not None else 0
+
+    return mantissa, fraction_digits, negative, valid
+
+# 文字配列を整数に変換する関数（空欄や数字でない値はdefaultにする）
+def _to_int(chars, default=-1):
+    mantissa, fraction_digits, negative, valid = _parse_fixed_point(chars)
+    values = np.where(negative, -mantissa, mantissa)
+    values[~valid] = default
+
+    # 小数点を含む列などは1つずつint()で変換する
+    if fraction_digits:
+        values[:] = default
+        valid[:] = False
+    for i in np.flatnonzero(~valid).tolist():
+        text = chars[i].tobytes().strip()
+        if text.lstrip(b"-").isdigit():
+            values[i] = int(text)
+
+    return values
+
+# 文字配列を実数に変換する関数（空欄はdefault、指数表記などはfloat()で1つずつ変換する）
+def _to_float(chars, default=np.nan):
+    mantissa, fraction_digits, negative, valid = _parse_fixed_point(chars)
+
+    # 整数÷10のべき乗は正しく丸められるため、float(文字列)と同じ値になる（"-0.000"も-0.0になる）
+    values = mantissa / 10.0 ** fraction_digits
+    values = np.where(negative, -values, values)
+    values[~valid] = default
+
+    for i in np.flatnonzero(~valid).tolist():
+        text = chars[i].tobytes().strip()
+        if text:
+            try:
+                values[i] = float(text)
+            except ValueError:
+                pass
+
+    return values
+
+# PDBのテキスト全体からATOM/HETATMレコードを一度にデコードする関数
+# 戻り値はカラム名をキーとした配列の辞書で、"line_index"には改行(\n)で区切った行番号が入る
+def decode_atom_records(data, records=("ATOM", "HETATM")):
+    if isinstance(data, str):
+        data = data.encode()
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    starts, ends = _line_bounds(raw)
+
+    # 行頭の文字列で対象のレコードを選ぶ
+    prefix_width = max(len(record) for record in records)
+    prefixes = _gather(raw, starts, ends, prefix_width)
+    selected = np.zeros(len(starts), dtype=bool)
+    for record in records:
+        code = np.frombuffer(record.encode(), dtype=np.uint8)
+        selected |= np.all(prefixes[:, :len(code)] == code, axis=1)
+    line_index = np.flatnonzero(selected)
+
+    table = _gather(raw, starts[line_index], ends[line_index], LINE_WIDTH)
+
+    decoded = {"line_index": line_index.astype(np.int64)}
+    for field in STRING_FIELDS:
+        decoded[field] = _to_str(_column(table, field))
+    for field in INT_FIELDS:
+        decoded[field] = _to_int(_column(table, field))
+    for field in FLOAT_FIELDS:
+        decoded[field] = _to_float(_column(table, field))
+
+    return decoded
+
+# PDBファイルを読み込み、ATOM/HETATMレコードをデコードする関数
+def read_atom_records(file_path, records=("ATOM", "HETATM")):
+    with open(file_path, "rb") as f:
+        return decode_atom_records(f.read(), records)
+
+# 比較用：1行ずつスライスしてfloat/intに変換する従来の方法（decode_atom_recordsと同じカラムを読む）
+def read_atom_records_by_line(file_path, records=("ATOM", "HETATM")):
+    atoms = []
+
+    with open(file_path, "r") as f:
+        for line in f:
+            if line.startswith(records):
+                line = line.rstrip("\n").ljust(LINE_WIDTH)
+                atoms.append((line[0:6].strip(), int(line[6:11].strip()), line[12:16].strip(), line[16].strip(), line[17:20].strip(),
+                              line[21].strip(), int(line[22:26].strip()), line[26].strip(),
+                              float(line[30:38].strip()), float(line[38:46].strip()), float(line[46:54].strip()),
+                              float(line[54:60].strip()), float(line[60:66].strip())))
+
+    return atoms
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode PDB ATOM/HETATM records and compare with line-by-line parsing")
+    parser.add_argument("pdb_file", type=str, help="Input PDB file")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Number of timing repeats (default: 3)")
+
+    args = parser.parse_args()
+
+    bulk_times = []
+    line_times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        decoded = read_atom_records(args.pdb_file)
+        bulk_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        atoms = read_atom_records_by_line(args.pdb_file)
+        line_times.append(time.perf_counter() - start)
+
+    if len(atoms) != len(decoded["line_index"]):
+        sys.exit("Record counts differ between bulk and line-by-line parsing")
+
+    print(f"Atoms: {len(atoms)}")
+    print(f"Line-by-line: {min(line_times):.4f} s")
+    print(f"Bulk decoder: {min(bulk_times):.4f} s ({min(line_times) / min(bulk_times):.1f}x)")
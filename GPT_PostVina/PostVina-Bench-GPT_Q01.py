@@ -0,0 +1,236 @@
+import os
+import sys
+import csv
+import math
+import time
+import random
+import inspect
+import argparse
+import resource
+import tempfile
+import itertools
+import importlib.util
+import multiprocessing
+
+# 受容体の1残基あたりの原子名（主鎖4原子＋側鎖4原子）
+RESIDUE_ATOMS = ["N", "CA", "C", "O", "CB", "CG", "CD", "CE"]
+
+# タンパク質中の原子密度の目安 (atoms/Å^3)、合成受容体の箱の大きさを決めるのに使う
+ATOM_DENSITY = 0.05
+
+# 計測する処理の名前（表示順）
+STEPS = ["parse_pdb", "parse_pdbqt", "load_receptor", "find_nearby_residues", "write_csv", "plot"]
+
+# 既定のベンチマーク対象（同じディレクトリにある最新版のPostVina）
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "PostVina-GPT_Q57.py")
+
+# 合成受容体のPDBファイルを作る関数（原子は立方体の中にランダムに配置する）
+def write_synthetic_pdb(file_path, atom_count, rng):
+    box_size = (atom_count / ATOM_DENSITY) ** (1 / 3)
+
+    with open(file_path, 'w') as f:
+        for atom_index in range(atom_count):
+            atom_label = RESIDUE_ATOMS[atom_index % len(RESIDUE_ATOMS)]
+            residue_number = atom_index // len(RESIDUE_ATOMS) + 1
+            x, y, z = (rng.uniform(0, box_size) for _ in range(3))
+            f.write("ATOM  %5d  %-3s ALA A%4d    %8.3f%8.3f%8.3f  1.00  0.00           %s\n"
+                    % (atom_index % 100000, atom_label, residue_number % 10000, x, y, z, atom_label[0]))
+        f.write("END\n")
+
+    return box_size
+
+# 合成リガンドのマルチMODEL PDBQTファイルを作る関数（受容体の中心付近にポーズを配置する）
+def write_synthetic_pdbqt(file_path, model_count, atom_count, box_size, rng):
+    ligand_size = 2.0 * atom_count ** (1 / 3)
+    center = box_size / 2
+
+    with open(file_path, 'w') as f:
+        for model_number in range(1, model_count + 1):
+            f.write(f"MODEL {model_number}\n")
+            f.write("REMARK VINA RESULT:    %6.1f      %.3f      %.3f\n"
+                    % (-10.0 + 0.2 * model_number, 0.0 if model_number == 1 else 1.5 * model_number, 0.0 if model_number == 1 else 2.0 * model_number))
+            offset = [center + rng.uniform(-3, 3) for _ in range(3)]
+            for atom_index in range(atom_count):
+                x, y, z = (offset[i] + rng.uniform(-ligand_size / 2, ligand_size / 2) for i in range(3))
+                f.write("ATOM  %5d  C%-2d UNL     1    %8.3f%8.3f%8.3f  0.00  0.00    +0.000 C \n"
+                        % (atom_index + 1, atom_index % 100, x, y, z))
+            f.write("ENDMDL\n")
+
+# ファイル名にハイフンを含むPostVinaスクリプトをモジュールとして読み込む関数
+def load_postvina(script_path):
+    spec = importlib.util.spec_from_file_location("postvina", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# 処理時間を計測する関数
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+# 格子インデックス法で距離を計算する原子ペアの数を数える関数（各リガンド原子の周囲27セルにある受容体原子数の合計）
+def count_grid_pairs(module, cell_index, pdbqt_file, threshold):
+    return sum(len(module.query_cell_index(cell_index, model_atom[2:], threshold))
+               for model in module.parse_pdbqt(pdbqt_file) for model_atom in model)
+
+# load_receptorが内部で使う受容体のパーサーを返す関数（Q55以降とnumpy法は配列形式、それ以外はリスト形式）
+def receptor_parser(module, method):
+    if method == "numpy" or hasattr(module, "pdb_arrays_to_data"):
+        return module.parse_pdb_arrays
+    return module.parse_pdb
+
+# analyze_ligandが使うPDBQTの読み込みを最後まで実行する関数（逐次読み込みを持つ版ではMODELを1つずつ読み捨てる）
+def read_all_pdbqt(module, pdbqt_file, method):
+    if method == "numpy":
+        reader = getattr(module, "iter_pdbqt_arrays", module.parse_pdbqt_arrays)
+    else:
+        reader = getattr(module, "iter_pdbqt", module.parse_pdbqt)
+    model_count = 0
+    for _ in reader(pdbqt_file):
+        model_count += 1
+    return model_count
+
+# 1つの条件でベンチマークを行う関数（独立したプロセスで実行し、ピークRSSを測る）
+# 選んだ手法が実際に使う処理だけを計測し、計測しなかった処理は空欄にする
+# load_receptorを持つ版では、parse_pdb・parse_pdbqtの列にload_receptor・analyze_ligandが使う読み込みだけを別に計測した時間を入れる
+# （load_receptor・find_nearby_residuesの時間に含まれるため、total_sには足さない）
+def run_case(case):
+    os.environ["MPLBACKEND"] = "Agg"
+    module = load_postvina(case["script"])
+
+    pdb_file = case["pdb_file"]
+    pdbqt_file = case["pdbqt_file"]
+    threshold = case["threshold"]
+    method = case["method"]
+    output_prefix = os.path.join(case["workdir"], f"out_{os.getpid()}")
+    times = {step: None for step in STEPS}
+    prune_counts = []
+    cell_index = None
+    stage_only = set()
+
+    # load_receptor / analyze_ligand を持つ版ではそれを使い（受容体・リガンドの読み込みも含む）、古い版では直接 find_nearby_residues を呼ぶ
+    if hasattr(module, "load_receptor"):
+        _, times["parse_pdb"] = timed(receptor_parser(module, method), pdb_file)
+        _, times["parse_pdbqt"] = timed(read_all_pdbqt, module, pdbqt_file, method)
+        stage_only = {"parse_pdb", "parse_pdbqt"}
+        receptor, times["load_receptor"] = timed(module.load_receptor, pdb_file, method, threshold)
+        if "prune_counts" in inspect.signature(module.analyze_ligand).parameters:
+            result, times["find_nearby_residues"] = timed(module.analyze_ligand, receptor, pdbqt_file, threshold, True, prune_counts)
+        else:
+            result, times["find_nearby_residues"] = timed(module.analyze_ligand, receptor, pdbqt_file, threshold)
+        nearby_residues_list = result[0] if isinstance(result, tuple) else result
+        cell_index = receptor.get("cell_index")
+    else:
+        method = "grid" if hasattr(module, "query_cell_index") and threshold > 0 else "brute"
+        pdb_data, times["parse_pdb"] = timed(module.parse_pdb, pdb_file)
+        pdbqt_models, times["parse_pdbqt"] = timed(module.parse_pdbqt, pdbqt_file)
+        nearby_residues_list, times["find_nearby_residues"] = timed(module.find_nearby_residues, pdb_data, pdbqt_models, threshold)
+
+    if hasattr(module, "write_list_csv"):
+        start = time.perf_counter()
+        module.write_list_csv(nearby_residues_list, f"{output_prefix}_list.csv")
+        module.write_count_csv(nearby_residues_list, f"{output_prefix}_count.csv")
+        times["write_csv"] = time.perf_counter() - start
+
+    if case["plot"]:
+        _, times["plot"] = timed(module.create_stacked_bar_chart, nearby_residues_list, f"{output_prefix}.png", threshold)
+
+    # ピークRSSはペア数を数える前に取得する（数えるための読み込みを含めない）
+    peak_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linuxではキロバイト単位
+
+    # 実際に距離を計算した原子ペアの数（前処理で除外した原子・格子で調べなかった原子は含めない）
+    if prune_counts:
+        atom_pairs = sum(kept for kept, _ in prune_counts) * case["ligand_atoms"]
+    elif method == "grid":
+        if cell_index is None:
+            cell_index = module.build_cell_index(module.parse_pdb(pdb_file), threshold)
+        atom_pairs = count_grid_pairs(module, cell_index, pdbqt_file, threshold)
+    else:
+        atom_pairs = case["receptor_atoms"] * case["models"] * case["ligand_atoms"]
+
+    search_time = times["find_nearby_residues"]
+
+    return {
+        "receptor_atoms": case["receptor_atoms"],
+        "models": case["models"],
+        "ligand_atoms": case["ligand_atoms"],
+        "method": method,
+        "contacts": sum(len(nearby_residues) for nearby_residues in nearby_residues_list),
+        **{f"{step}_s": round(times[step], 4) if times[step] is not None else "" for step in STEPS},
+        "total_s": round(sum(value for step, value in times.items() if value is not None and step not in stage_only), 4),
+        "peak_rss_mb": peak_rss_mb,
+        "pairs_evaluated": atom_pairs,
+        "pairs_per_s": round(atom_pairs / search_time) if search_time > 0 else math.inf,
+    }
+
+# 結果を表形式で表示する関数
+def print_results(results):
+    columns = list(results[0].keys())
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).rjust(width) for column, width in zip(columns, widths)))
+
+def main(args):
+    rng = random.Random(args.seed)
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        # 受容体・リガンドの合成ファイルを先に作っておく
+        receptor_files = {}
+        for receptor_atoms in args.receptor_atoms:
+            pdb_file = os.path.join(workdir, f"receptor_{receptor_atoms}.pdb")
+            receptor_files[receptor_atoms] = (pdb_file, write_synthetic_pdb(pdb_file, receptor_atoms, rng))
+
+        cases = []
+        for receptor_atoms, models, ligand_atoms in itertools.product(args.receptor_atoms, args.models, args.ligand_atoms):
+            pdb_file, box_size = receptor_files[receptor_atoms]
+            pdbqt_file = os.path.join(workdir, f"ligand_{receptor_atoms}_{models}_{ligand_atoms}.pdbqt")
+            write_synthetic_pdbqt(pdbqt_file, models, ligand_atoms, box_size, rng)
+            for method in args.methods:
+                cases.append({
+                    "script": os.path.abspath(args.script),
+                    "workdir": workdir,
+                    "pdb_file": pdb_file,
+                    "pdbqt_file": pdbqt_file,
+                    "receptor_atoms": receptor_atoms,
+                    "models": models,
+                    "ligand_atoms": ligand_atoms,
+                    "method": method,
+                    "threshold": args.threshold,
+                    "plot": args.plot,
+                })
+
+        # spawnで毎回新しいプロセスを起動し、条件ごとのピークRSSが混ざらないようにする
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for result in pool.imap(run_case, cases):
+                results.append(result)
+                print(f"receptor={result['receptor_atoms']} models={result['models']} ligand={result['ligand_atoms']} "
+                      f"method={result['method']}: {result['total_s']} s", file=sys.stderr)
+
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', newline='') as csvfile:
+            csv_writer = csv.DictWriter(csvfile, fieldnames=list(results[0].keys()))
+            csv_writer.writeheader()
+            csv_writer.writerows(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PostVina contact analysis on synthetic receptors and poses")
+    parser.add_argument("--script", type=str, default=DEFAULT_SCRIPT, help="PostVina script to benchmark (default: PostVina-GPT_Q57.py)")
+    parser.add_argument("--receptor-atoms", type=int, nargs="+", default=[1000, 5000, 20000, 50000], help="Receptor sizes in atoms (default: 1000 5000 20000 50000)")
+    parser.add_argument("--models", type=int, nargs="+", default=[1, 9, 100], help="Number of MODELs per PDBQT file (default: 1 9 100)")
+    parser.add_argument("--ligand-atoms", type=int, nargs="+", default=[20, 200], help="Ligand atoms per MODEL (default: 20 200)")
+    parser.add_argument("-m", "--methods", type=str, nargs="+", default=["numpy"], help="Neighbor search methods to compare (default: numpy)")
+    parser.add_argument("-t", "--threshold", type=float, default=5.0, help="Distance threshold for nearby residues (default: 5.0)")
+    parser.add_argument("--plot", action="store_true", help="Also time the stacked bar chart writer")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic structures (default: 0)")
+    parser.add_argument("--workdir", type=str, default=None, help="Directory for temporary synthetic files (default: system temp)")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Write the results to a CSV file")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,486 @@
+import os
+import sys
+import csv
+import re
+import math
+import glob
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import matplotlib.pyplot as plt
+
+# PDBファイルを解析する関数
+def parse_pdb(file_path):
+    with open(file_path, 'r') as f:
+        pdb_lines = f.readlines()
+
+    data_matrix = []
+
+    for line in pdb_lines:
+        if line.startswith("ATOM"):
+            atom_label = line[12:16].strip()
+            if atom_label not in ["C", "N", "O", "CA"]:
+                residue_name = line[17:20].strip()
+                residue_number = int(line[22:26].strip())
+                x = float(line[30:38].strip())
+                y = float(line[38:46].strip())
+                z = float(line[46:54].strip())
+
+                data_matrix.append([atom_label, residue_name, residue_number, x, y, z])
+
+    return data_matrix
+
+# PDBQTファイルを1行ずつ読み、MODELごとに原子のリストを返すジェネレーター
+def iter_pdbqt(file_path):
+    current_model = []
+    model_number = 0
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith('MODEL'):
+                model_number = int(line.split()[1])  # MODELの番号を取得
+                current_model = []
+            elif line.startswith('ATOM') or line.startswith('HETATM'):
+                atom_label = line[12:16].strip()
+                x = float(line[30:38].strip())
+                y = float(line[38:46].strip())
+                z = float(line[46:54].strip())
+                current_model.append((model_number, atom_label, x, y, z))  # MODEL番号を追加
+            elif line.startswith('ENDMDL'):
+                yield current_model
+
+# PDBQTファイルを解析する関数
+def parse_pdbqt(file_path):
+    return list(iter_pdbqt(file_path))
+
+# PDBファイルを解析し、列ごとの配列（座標はN×3）にまとめる関数
+def parse_pdb_arrays(file_path):
+    atom_labels = []
+    residue_names = []
+    residue_numbers = []
+    coords = []
+
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.startswith("ATOM"):
+                atom_label = line[12:16].strip()
+                if atom_label not in ["C", "N", "O", "CA"]:
+                    atom_labels.append(atom_label)
+                    residue_names.append(line[17:20].strip())
+                    residue_numbers.append(int(line[22:26].strip()))
+                    coords.append((float(line[30:38].strip()), float(line[38:46].strip()), float(line[46:54].strip())))
+
+    return {
+        "atom_labels": np.array(atom_labels, dtype=str),
+        "residue_names": np.array(residue_names, dtype=str),
+        "residue_numbers": np.array(residue_numbers, dtype=np.int64),
+        "coords": np.array(coords, dtype=np.float64).reshape(-1, 3),
+    }
+
+# REMARK VINA RESULT行から結合エネルギーとRMSD（lb, ub）を取り出す関数
+def parse_vina_result(line):
+    values = line.split(':', 1)[1].split()
+    return {"affinity": float(values[0]), "rmsd_lb": float(values[1]), "rmsd_ub": float(values[2])}
+
+# PDBQTファイルを1行ずつ読み、MODELごとに列ごとの配列を返すジェネレーター（ファイル全体をメモリに載せない）
+def iter_pdbqt_arrays(file_path):
+    atom_labels = []
+    coords = []
+    vina_result = None
+    model_number = 0
+
+    with open(file_path, 'r') as file:
+        for line in file:
+            if line.startswith('MODEL'):
+                model_number = int(line.split()[1])  # MODELの番号を取得
+                atom_labels = []
+                coords = []
+                vina_result = None
+            elif line.startswith('REMARK VINA RESULT'):
+                vina_result = parse_vina_result(line)
+            elif line.startswith('ATOM') or line.startswith('HETATM'):
+                atom_labels.append(line[12:16].strip())
+                coords.append((float(line[30:38].strip()), float(line[38:46].strip()), float(line[46:54].strip())))
+            elif line.startswith('ENDMDL'):
+                yield {
+                    "model_number": model_number,
+                    "vina_result": vina_result,
+                    "atom_labels": np.array(atom_labels, dtype=str),
+                    "coords": np.array(coords, dtype=np.float64).reshape(-1, 3),
+                }
+
+# PDBQTファイルを解析し、MODELごとに列ごとの配列へまとめる関数
+def parse_pdbqt_arrays(file_path):
+    return list(iter_pdbqt_arrays(file_path))
+
+# 座標間の距離を計算する関数
+def calculate_distance(coord1, coord2):
+    return math.sqrt(sum((a - b) ** 2 for a, b in zip(coord1, coord2)))
+
+# 受容体原子をthreshold幅の格子（セル）に振り分ける関数
+def build_cell_index(pdb_data, cell_size):
+    cell_index = {}
+
+    for atom_index, pdb_atom in enumerate(pdb_data):
+        x, y, z = pdb_atom[3:]
+        cell = (math.floor(x / cell_size), math.floor(y / cell_size), math.floor(z / cell_size))
+        cell_index.setdefault(cell, []).append(atom_index)
+
+    return cell_index
+
+# 座標の周囲27セルに含まれる受容体原子の番号を返す関数
+def query_cell_index(cell_index, coord, cell_size):
+    cx, cy, cz = (math.floor(c / cell_size) for c in coord)
+    neighbors = []
+
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                neighbors.extend(cell_index.get((cx + dx, cy + dy, cz + dz), ()))
+
+    return neighbors
+
+# 近くの残基を見つける関数（全原子の総当たり）
+def find_nearby_residues_brute(pdb_data, pdbqt_models, threshold):
+    nearby_residues_list = []
+
+    for model in pdbqt_models:
+        nearby_residues = set()
+        for pdb_atom in pdb_data:
+            for model_atom in model:
+                distance = calculate_distance(pdb_atom[3:], model_atom[2:])
+                if distance <= threshold:
+                    nearby_residues.add((pdb_atom[0], pdb_atom[1], pdb_atom[2], model_atom[0], model_atom[1], round(distance, 2)))  # distanceを小数点第2位まで丸める
+        nearby_residues_list.append(nearby_residues)
+
+    return nearby_residues_list
+
+# 近くの残基を見つける関数（格子インデックスで候補を絞り込む）
+def find_nearby_residues(pdb_data, pdbqt_models, threshold, cell_index=None):
+    if threshold <= 0:
+        return find_nearby_residues_brute(pdb_data, pdbqt_models, threshold)
+
+    # インデックスは受容体ごとに一度だけ作成する
+    if cell_index is None:
+        cell_index = build_cell_index(pdb_data, threshold)
+
+    nearby_residues_list = []
+
+    for model in pdbqt_models:
+        nearby_residues = set()
+        for model_atom in model:
+            for atom_index in query_cell_index(cell_index, model_atom[2:], threshold):
+                pdb_atom = pdb_data[atom_index]
+                distance = calculate_distance(pdb_atom[3:], model_atom[2:])
+                if distance <= threshold:
+                    nearby_residues.add((pdb_atom[0], pdb_atom[1], pdb_atom[2], model_atom[0], model_atom[1], round(distance, 2)))  # distanceを小数点第2位まで丸める
+        nearby_residues_list.append(nearby_residues)
+
+    return nearby_residues_list
+
+# 近くの残基を見つける関数（配列のブロードキャストで距離をまとめて計算する）
+def find_nearby_residues_arrays(pdb_arrays, pdbqt_models, threshold, chunk_size=4096):
+    pdb_coords = pdb_arrays["coords"]
+    atom_labels = pdb_arrays["atom_labels"].tolist()
+    residue_names = pdb_arrays["residue_names"].tolist()
+    residue_numbers = pdb_arrays["residue_numbers"].tolist()
+
+    nearby_residues_list = []
+
+    for model in pdbqt_models:
+        nearby_residues = set()
+        model_number = model["model_number"]
+        model_labels = model["atom_labels"].tolist()
+        model_coords = model["coords"]
+
+        # 受容体原子をchunk_sizeごとに区切り、(受容体原子数×リガンド原子数)の距離行列を作る
+        for start in range(0, len(pdb_coords), chunk_size):
+            diff = pdb_coords[start:start + chunk_size, None, :] - model_coords[None, :, :]
+            distances = np.sqrt(diff[..., 0] ** 2 + diff[..., 1] ** 2 + diff[..., 2] ** 2)
+            pdb_indices, model_indices = np.nonzero(distances <= threshold)
+            for pdb_index, model_index in zip(pdb_indices.tolist(), model_indices.tolist()):
+                atom_index = start + pdb_index
+                distance = float(distances[pdb_index, model_index])
+                nearby_residues.add((atom_labels[atom_index], residue_names[atom_index], residue_numbers[atom_index], model_number, model_labels[model_index], round(distance, 2)))  # distanceを小数点第2位まで丸める
+        nearby_residues_list.append(nearby_residues)
+
+    return nearby_residues_list
+
+def create_stacked_bar_chart(nearby_residues_list, output_image, threshold):
+    residue_scores = {}
+
+    for i, nearby_residues in enumerate(nearby_residues_list):
+        for _, _, residue_number, _, _, distance in nearby_residues:
+            score = 1 - (distance / threshold)  # スコアを計算
+            if residue_number not in residue_scores:
+                residue_scores[residue_number] = [0] * len(nearby_residues_list)
+            residue_scores[residue_number][i] += score
+
+    residue_numbers = list(residue_scores.keys())
+    residue_numbers.sort()
+
+    data_matrix = [residue_scores[residue_number] for residue_number in residue_numbers]
+
+    fig, ax = plt.subplots(figsize=(10, 6), constrained_layout=True)
+
+    bottoms = [0] * len(residue_numbers)
+    max_height = 0
+    for model_index in range(len(nearby_residues_list)):
+        model_data = [data_matrix[row_index][model_index] for row_index in range(len(residue_numbers))]
+        bar_container = ax.bar(residue_numbers, model_data, bottom=bottoms, label=f'MODEL {model_index + 1}')
+        bottoms = [sum(x) for x in zip(bottoms, model_data)]
+
+        # 最後のモデルの場合、各棒グラフの上に残基番号を表示
+        if model_index == len(nearby_residues_list) - 1:
+            for bar, residue_number, total_height in zip(bar_container, residue_numbers, bottoms):
+                height = bar.get_height()
+                if total_height > 0:  # 総積み上げ高さが0より大きい場合のみ残基番号を表示
+                    ax.text(bar.get_x() + bar.get_width() / 2, total_height, str(residue_number),
+                            ha='center', va='bottom', fontsize=8, rotation=90)
+                    
+        # 最大の積み上げ高さを更新
+        max_height = max(max_height, max(bottoms))
+
+    # 縦軸の最大値を設定
+    ax.set_ylim(0, max_height * 1.1)  # 最大値の10%上に設定
+
+    # 凡例を右端に表示
+    ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left')
+    
+    ax.set_xticks(residue_numbers)
+    ax.set_xticklabels(residue_numbers)
+    ax.set_xlabel('Residue Numbers')
+    ax.set_ylabel('Score of Nearby Residues')  # 縦軸のラベルを変更
+    ax.set_title('Score of Nearby Residues per Residue Number')
+
+    plt.legend()
+    plt.savefig(output_image, dpi=300)
+    plt.close()
+
+
+# 受容体を一度だけ読み込み、選択した手法に必要なデータをまとめる関数
+def load_receptor(pdb_file, method, threshold):
+    if method == "numpy":
+        return {"method": method, "pdb_arrays": parse_pdb_arrays(pdb_file)}
+
+    pdb_data = parse_pdb(pdb_file)
+    receptor = {"method": method, "pdb_data": pdb_data}
+    if method == "grid" and threshold > 0:
+        receptor["cell_index"] = build_cell_index(pdb_data, threshold)  # 格子インデックスも一度だけ作成する
+
+    return receptor
+
+# 読み込み済みの受容体に対して1つのPDBQTファイルを解析する関数
+def analyze_ligand(receptor, pdbqt_file, threshold):
+    method = receptor["method"]
+
+    if method == "numpy":
+        pdbqt_models = iter_pdbqt_arrays(pdbqt_file)  # MODELを1つずつ読み込みながら解析する
+        return find_nearby_residues_arrays(receptor["pdb_arrays"], pdbqt_models, threshold)
+
+    pdbqt_models = iter_pdbqt(pdbqt_file)
+    if method == "brute":
+        return find_nearby_residues_brute(receptor["pdb_data"], pdbqt_models, threshold)
+
+    return find_nearby_residues(receptor["pdb_data"], pdbqt_models, threshold, receptor.get("cell_index"))
+
+# 近接残基を残基番号・原子名・距離の順に並べるためのキー
+def contact_sort_key(contact):
+    pdb_label, residue_name, residue_number, model_number, atom_label, distance = contact
+    return (residue_number, residue_name, pdb_label, distance, atom_label)
+
+# 近接残基の一覧をCSVファイルに書き込む関数
+def write_list_csv(nearby_residues_list, output_csv_list):
+    with open(output_csv_list, 'w', newline='') as csvfile:
+        # CSVファイルに結果を書き込む
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(['PDB_Atom', 'Residue_Name', 'Residue_Number', 'PDBQT_Model', 'PDBQT_Atom', 'Distance'])
+
+        # setの順序はプロセスごとに変わるため、並べ替えてから書き込む（並列実行でも同じ出力になる）
+        for i, nearby_residues in enumerate(nearby_residues_list):
+            for pdb_label, residue_name, residue_number, model_number, atom_label, distance in sorted(nearby_residues, key=contact_sort_key):
+                csv_writer.writerow([pdb_label, residue_name, residue_number, model_number, atom_label, distance])
+
+# 残基番号ごとの近接数をCSVファイルに書き込む関数
+def write_count_csv(nearby_residues_list, output_csv_count):
+    with open(output_csv_count, 'w', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        csv_writer.writerow(['Residue_Number'] + [f'MODEL {i + 1}' for i in range(len(nearby_residues_list))])
+
+        residue_counts = {}
+        for i, nearby_residues in enumerate(nearby_residues_list):
+            for _, _, residue_number, _, _, _ in nearby_residues:
+                if residue_number not in residue_counts:
+                    residue_counts[residue_number] = [0] * len(nearby_residues_list)
+                residue_counts[residue_number][i] += 1
+
+        for residue_number in sorted(residue_counts):
+            csv_writer.writerow([residue_number] + residue_counts[residue_number])
+
+# 全リガンドをまとめた集計表の行を作る関数（リガンド・MODEL・残基ごとの近接数とスコア）
+def summarize_contacts(ligand_name, nearby_residues_list, threshold):
+    summary = {}
+
+    for i, nearby_residues in enumerate(nearby_residues_list):
+        for _, residue_name, residue_number, _, _, distance in nearby_residues:
+            key = (i + 1, residue_number, residue_name)
+            if key not in summary:
+                summary[key] = [0, 0.0]
+            summary[key][0] += 1
+            summary[key][1] += 1 - (distance / threshold)  # 棒グラフと同じスコア
+
+    return [[ligand_name, model_index, residue_number, residue_name, count, round(score, 4)]
+            for (model_index, residue_number, residue_name), (count, score) in sorted(summary.items())]
+
+# 引数からPDBQTファイルの一覧を作る関数（ディレクトリ・ワイルドカード・単一ファイル）
+def collect_pdbqt_files(pdbqt_path):
+    if os.path.isdir(pdbqt_path):
+        return sorted(glob.glob(os.path.join(pdbqt_path, "*.pdbqt")))
+    if glob.has_magic(pdbqt_path):
+        return sorted(glob.glob(pdbqt_path))
+    return [pdbqt_path]
+
+# 出力ファイル名に使うリガンド名を作る関数（ファイル名が重複する場合は親ディレクトリ名を付け、それでも重複すれば連番を付ける）
+def make_ligand_names(pdbqt_files):
+    stems = [os.path.splitext(os.path.basename(pdbqt_file))[0] for pdbqt_file in pdbqt_files]
+    stem_counts = {}
+    for stem in stems:
+        stem_counts[stem] = stem_counts.get(stem, 0) + 1
+
+    ligand_names = []
+    used_names = set()
+    for pdbqt_file, stem in zip(pdbqt_files, stems):
+        if stem_counts[stem] > 1:
+            stem = f"{os.path.basename(os.path.dirname(os.path.abspath(pdbqt_file)))}_{stem}"
+        ligand_name = stem
+        index = 1
+        while ligand_name in used_names:
+            index += 1
+            ligand_name = f"{stem}_{index}"
+        used_names.add(ligand_name)
+        ligand_names.append(ligand_name)
+
+    return ligand_names
+
+# 1つのリガンドを解析して個別のCSV（と画像）を書き出し、集計表の行を返す関数
+def process_ligand(receptor, pdbqt_file, ligand_name, output_prefix, threshold, plot):
+    ligand_prefix = f"{output_prefix}_{ligand_name}"
+
+    nearby_residues_list = analyze_ligand(receptor, pdbqt_file, threshold)
+
+    write_list_csv(nearby_residues_list, f"{ligand_prefix}_list.csv")
+    write_count_csv(nearby_residues_list, f"{ligand_prefix}_count.csv")
+    if plot:
+        create_stacked_bar_chart(nearby_residues_list, f"{ligand_prefix}.png", threshold)
+
+    contact_count = sum(len(nearby_residues) for nearby_residues in nearby_residues_list)
+    return ligand_name, summarize_contacts(ligand_name, nearby_residues_list, threshold), contact_count
+
+# ワーカープロセスが使う受容体（プロセスごとに一度だけ設定される）
+_worker_receptor = None
+_worker_shm = None
+
+# ワーカープロセスの初期化関数（受容体座標は共有メモリから参照する）
+def init_worker(receptor, shm_name, coords_shape):
+    global _worker_receptor, _worker_shm
+
+    if shm_name is not None:
+        _worker_shm = shared_memory.SharedMemory(name=shm_name)
+        coords = np.ndarray(coords_shape, dtype=np.float64, buffer=_worker_shm.buf)
+        receptor = dict(receptor, pdb_arrays=dict(receptor["pdb_arrays"], coords=coords))
+
+    _worker_receptor = receptor
+
+# ワーカープロセスで1つのリガンドを処理する関数
+def process_ligand_worker(task):
+    pdbqt_file, ligand_name, output_prefix, threshold, plot = task
+    return process_ligand(_worker_receptor, pdbqt_file, ligand_name, output_prefix, threshold, plot)
+
+# 複数のPDBQTファイルを1つの受容体に対して解析する関数（jobs > 1 の場合は並列実行）
+def run_batch(args, pdbqt_files):
+    threshold = args.threshold
+    receptor = load_receptor(args.pdb_file, args.method, threshold)
+    ligand_names = make_ligand_names(pdbqt_files)
+
+    output_csv_summary = f"{args.output_prefix}_summary.csv"
+    with open(output_csv_summary, 'w', newline='') as summary_file:
+        summary_writer = csv.writer(summary_file)
+        summary_writer.writerow(['Ligand', 'PDBQT_Model', 'Residue_Number', 'Residue_Name', 'Count', 'Score'])
+
+        jobs = min(args.jobs, len(pdbqt_files))
+        if jobs <= 1:
+            results = (process_ligand(receptor, pdbqt_file, ligand_name, args.output_prefix, threshold, args.plot) for pdbqt_file, ligand_name in zip(pdbqt_files, ligand_names))
+            write_batch_results(results, summary_writer)
+            return
+
+        shm = None
+        shm_name = None
+        coords_shape = None
+        worker_receptor = receptor
+
+        # numpy法では座標配列を共有メモリに置き、タスクごとにpickleしないようにする
+        if args.method == "numpy":
+            coords = receptor["pdb_arrays"]["coords"]
+            shm = shared_memory.SharedMemory(create=True, size=max(coords.nbytes, 1))
+            np.ndarray(coords.shape, dtype=np.float64, buffer=shm.buf)[:] = coords
+            shm_name = shm.name
+            coords_shape = coords.shape
+            worker_receptor = dict(receptor, pdb_arrays={key: value for key, value in receptor["pdb_arrays"].items() if key != "coords"})
+
+        try:
+            tasks = [(pdbqt_file, ligand_name, args.output_prefix, threshold, args.plot) for pdbqt_file, ligand_name in zip(pdbqt_files, ligand_names)]
+            with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(worker_receptor, shm_name, coords_shape)) as pool:
+                # imapは入力順に結果を返すため、集計表の順序は逐次実行と同じになる
+                write_batch_results(pool.imap(process_ligand_worker, tasks), summary_writer)
+        finally:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+
+# 各リガンドの結果を集計表に書き込む関数
+def write_batch_results(results, summary_writer):
+    for ligand_name, summary_rows, contact_count in results:
+        summary_writer.writerows(summary_rows)
+        print(f"{ligand_name}: {contact_count} contacts")
+
+def main(args):
+    pdb_file = args.pdb_file
+    pdbqt_file = args.pdbqt_file
+    output_prefix = args.output_prefix
+    threshold = args.threshold
+
+    # ディレクトリまたはワイルドカードが指定された場合はバッチ処理を行う
+    if os.path.isdir(pdbqt_file) or glob.has_magic(pdbqt_file):
+        pdbqt_files = collect_pdbqt_files(pdbqt_file)
+        if not pdbqt_files:
+            sys.exit(f"No PDBQT files found: {pdbqt_file}")
+        run_batch(args, pdbqt_files)
+        return
+
+    receptor = load_receptor(pdb_file, args.method, threshold)
+    nearby_residues_list = analyze_ligand(receptor, pdbqt_file, threshold)
+
+    output_csv_list = f"{output_prefix}_list.csv"
+    write_list_csv(nearby_residues_list, output_csv_list)
+
+    # 画像ファイル名を生成
+    output_image = f"{output_prefix}.png"
+    create_stacked_bar_chart(nearby_residues_list, output_image, threshold)
+
+    # 出力用のCSVファイル名を生成
+    output_csv_count = f"{output_prefix}_count.csv"
+    write_count_csv(nearby_residues_list, output_csv_count)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find nearby residues in PDBQT models")
+    parser.add_argument("pdb_file", type=str, help="Input PDB file")
+    parser.add_argument("pdbqt_file", type=str, help="Input PDBQT file, or a directory / wildcard pattern of PDBQT files for batch mode")
+    parser.add_argument("output_prefix", type=str, help="Output file prefix")
+    parser.add_argument("-t", "--threshold", type=float, default=5.0, help="Distance threshold for nearby residues (default: 5.0)")
+    parser.add_argument("-m", "--method", type=str, choices=["numpy", "grid", "brute"], default="numpy", help="Neighbor search method (default: numpy)")
+    parser.add_argument("--plot", action="store_true", help="Also draw a stacked bar chart for each ligand in batch mode")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes in batch mode (default: 1)")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,814 @@
+import sys
+import csv
+import math
+import os
+import re
+import gzip
+import json
+import mmap
+import shutil
+import hashlib
+import argparse
+import queue
+import tempfile
+import threading
+from collections import OrderedDict
+from Bio import PDB
+from Bio.PDB.Polypeptide import PPBuilder, protein_letters_3to1
+from Bio.PDB.PDBExceptions import PDBConstructionWarning
+import tkinter as tk
+from tkinter import ttk
+from tkinter import filedialog
+from tkinter import font as tkfont
+from io import StringIO
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import numpy as np
+from scipy.stats import kde
+import matplotlib.colors as mcolors
+import matplotlib.cm as cm
+from scipy.stats import gaussian_kde  
+
+
+# 構造ファイルのキャッシュの設定（起動時のオプションで変更します）
+# cache_dir: ダウンロードした構造を保存するディレクトリ
+# mirror_dir: PDBのdivided形式のローカルミラー（mmCIF/ab/1abc.cif.gz、pdb/ab/pdb1abc.ent.gz）、読み取りのみ
+# offline: Trueならネットワークからはダウンロードしない
+structure_cache = {
+    "cache_dir": os.path.join(os.path.expanduser("~"), ".cache", "ramaGPT4", "structures"),
+    "mirror_dir": None,
+    "offline": False,
+}
+
+# このセッションで一度探したPDB IDとファイルの対応
+fetched_files = {}
+
+# キャッシュの索引（PDB ID → ファイルの内容のSHA-256と拡張子）を読み込む関数
+def load_cache_index(cache_dir):
+    index_path = os.path.join(cache_dir, "index.json")
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache_index(cache_dir, index):
+    index_path = os.path.join(cache_dir, "index.json")
+    temporary_path = f"{index_path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, index_path)
+
+# 内容のハッシュから、キャッシュ内のファイルの場所を返す関数（objects/ab/abcdef....cif）
+def cache_object_path(cache_dir, digest, extension):
+    return os.path.join(cache_dir, "objects", digest[:2], f"{digest}{extension}")
+
+# 構造ファイル（.gzなら展開して）を内容のハッシュの名前でキャッシュに保存し、索引に登録する関数
+# 同じ内容のファイルは1つだけ保存されます。
+def add_to_cache(pdb_id, source_path, extension, cache_dir):
+    opener = gzip.open if source_path.endswith(".gz") else open
+    with opener(source_path, "rb") as f:
+        content = f.read()
+
+    digest = hashlib.sha256(content).hexdigest()
+    object_path = cache_object_path(cache_dir, digest, extension)
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temporary_path = f"{object_path}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(content)
+        os.replace(temporary_path, object_path)
+
+    index = load_cache_index(cache_dir)
+    index[pdb_id] = {"sha256": digest, "extension": extension}
+    save_cache_index(cache_dir, index)
+
+    return object_path
+
+# キャッシュの索引からPDB IDのファイルを探す関数（見つからなければNone）
+def find_in_cache(pdb_id, cache_dir):
+    entry = load_cache_index(cache_dir).get(pdb_id)
+    if entry is None:
+        return None
+    object_path = cache_object_path(cache_dir, entry["sha256"], entry["extension"])
+    return object_path if os.path.exists(object_path) else None
+
+# ローカルミラーからPDB IDのファイルを探す関数（mmCIFを優先し、見つからなければNone）
+def find_in_mirror(pdb_id, mirror_dir):
+    middle = pdb_id[1:3]
+    candidates = [
+        (os.path.join(mirror_dir, "mmCIF", middle, f"{pdb_id}.cif.gz"), ".cif"),
+        (os.path.join(mirror_dir, "mmCIF", middle, f"{pdb_id}.cif"), ".cif"),
+        (os.path.join(mirror_dir, "pdb", middle, f"pdb{pdb_id}.ent.gz"), ".ent"),
+        (os.path.join(mirror_dir, "pdb", middle, f"pdb{pdb_id}.ent"), ".ent"),
+    ]
+    for path, extension in candidates:
+        if os.path.exists(path):
+            return path, extension
+    return None
+
+# PDB IDの構造ファイルを返す関数
+# セッション内の記録 → キャッシュ → ローカルミラー → ダウンロードの順に探し、ミラーやダウンロードで得たファイルはキャッシュに保存します。
+def fetch_pdb(pdb_id):
+    pdb_id = pdb_id.strip().lower()
+    if pdb_id in fetched_files and os.path.exists(fetched_files[pdb_id]):
+        return fetched_files[pdb_id]
+
+    cache_dir = structure_cache["cache_dir"]
+    filename = find_in_cache(pdb_id, cache_dir)
+
+    if filename is None and structure_cache["mirror_dir"]:
+        found = find_in_mirror(pdb_id, structure_cache["mirror_dir"])
+        if found is not None:
+            filename = add_to_cache(pdb_id, found[0], found[1], cache_dir)
+
+    if filename is None:
+        if structure_cache["offline"]:
+            raise FileNotFoundError(f"{pdb_id} is not in the structure cache or the local mirror (offline mode).")
+
+        # 一時ディレクトリにダウンロードしてからキャッシュに移します。
+        with tempfile.TemporaryDirectory() as download_dir:
+            pdb_list = PDB.PDBList()
+            downloaded = pdb_list.retrieve_pdb_file(pdb_id, pdir=download_dir)
+            if not downloaded or not os.path.exists(downloaded):
+                raise FileNotFoundError(f"Could not download {pdb_id}.")
+            filename = add_to_cache(pdb_id, downloaded, os.path.splitext(downloaded)[1], cache_dir)
+
+    fetched_files[pdb_id] = filename
+    return filename
+
+    phi_psi_data = extract_phi_psi(pdb_id, chain_id, structure)
+    write_to_csv(phi_psi_data, csv_output)
+    
+    csv_text.delete('1.0', tk.END)
+    csv_output_str = csv_output.getvalue().replace('\r\n', '\n').replace('\r', '\n')
+    csv_text.insert(tk.END, csv_output_str)
+    
+    plot_scatter(phi_psi_data)
+
+# 解析済みの構造とφ/ψの表を保持するセッション内のLRUキャッシュ
+# 構造はファイルの場所・更新時刻・大きさ、φ/ψの表はそれに鎖IDを加えたキーで保存し、上限を超えたら最も古く使ったものから捨てます。
+session_cache = {
+    "structures": OrderedDict(),
+    "phi_psi": OrderedDict(),
+    "max_structures": 4,
+    "max_phi_psi": 64,
+}
+
+# LRUキャッシュから値を取り出す関数（見つかった値は最近使ったものとして末尾に移します）
+def cache_get(cache, key):
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key]
+
+# LRUキャッシュに値を入れ、上限を超えた古い値を捨てる関数
+def cache_put(cache, key, value, max_size):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+# ファイルが変わったら別のキーになるように、場所・更新時刻・大きさからキーを作る関数
+def file_cache_key(filename):
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+
+# 構造ファイルを拡張子に合ったパーサーで読み込む関数（同じファイルはキャッシュから返します）
+def load_structure(pdb_id, filename):
+    key = file_cache_key(filename)
+    structure = cache_get(session_cache["structures"], key)
+    if structure is not None:
+        return structure
+
+    file_format = os.path.splitext(filename)[1]
+    if file_format == ".ent":
+        parser = PDB.PDBParser(QUIET=True, PERMISSIVE=False)
+    elif file_format == ".cif":
+        parser = PDB.MMCIFParser(QUIET=True)
+    else:
+        raise ValueError("Invalid file format. Use either '.ent' (PDB) or '.cif' (mmCIF).")
+
+    structure = parser.get_structure(pdb_id, filename)
+    cache_put(session_cache["structures"], key, structure, session_cache["max_structures"])
+    return structure
+
+def read_pdb(pdb_file):
+    parser = PDB.PDBParser(QUIET=True, PERMISSIVE=False)
+    structure = parser.get_structure("structure", pdb_file)
+    return structure
+
+# 構造ファイルと鎖IDからφ/ψの表を返す関数（同じファイル・同じ鎖は解析し直さずにキャッシュから返します）
+def extract_phi_psi(pdb_id, chain_id, filename):
+    key = file_cache_key(filename) + (chain_id,)
+    phi_psi = cache_get(session_cache["phi_psi"], key)
+    if phi_psi is not None:
+        return phi_psi
+
+    structure = load_structure(pdb_id, filename)
+    phi_psi = structure_phi_psi(structure, chain_id)
+    cache_put(session_cache["phi_psi"], key, phi_psi, session_cache["max_phi_psi"])
+    return phi_psi
+
+# 解析済みの構造の最初のモデルから、指定した鎖のφ/ψを取り出す関数
+def structure_phi_psi(structure, chain_id):
+    if chain_id not in [chain.id for chain in structure[0]]:
+        raise ValueError(f"Chain {chain_id} not found in PDB structure.")
+
+    ppb = PPBuilder()
+    phi_psi = []
+
+    for pp in ppb.build_peptides(structure[0][chain_id], aa_only=False):
+        for residue, angles in zip(pp, pp.get_phi_psi_list()):
+            res_name = residue.get_resname().upper()
+            res_id = residue.get_id()[1]
+
+            if res_name in PDB.Polypeptide.aa3:
+                res_name_1 = protein_letters_3to1[res_name]
+                phi, psi = angles
+
+                if phi and psi:
+                    phi_degrees = math.degrees(phi)
+                    psi_degrees = math.degrees(psi)
+                    phi_psi.append([res_name_1, res_id, phi_degrees, psi_degrees])
+
+    return phi_psi
+
+def extract_pdb_phi_psi(structure, chain_id):
+    if chain_id not in [chain.id for chain in structure[0]]:
+        raise ValueError(f"Chain {chain_id} not found in PDB structure.")
+
+    ppb = PPBuilder()
+    phi_psi = []
+
+    for pp in ppb.build_peptides(structure[0][chain_id], aa_only=False):
+        for residue, angles in zip(pp, pp.get_phi_psi_list()):
+            res_name = residue.get_resname()
+            res_id = residue.get_id()[1]
+
+            if res_name in PDB.Polypeptide.aa3:
+                res_name_1 = three_to_one(res_name)
+                phi, psi = angles
+
+                if phi and psi:
+                    phi_degrees = math.degrees(phi)
+                    psi_degrees = math.degrees(psi)
+                    phi_psi.append([res_name_1, res_id, phi_degrees, psi_degrees])
+
+    return phi_psi
+
+def write_to_csv(phi_psi_data, csv_output):
+    csv_writer = csv.writer(csv_output)
+    csv_writer.writerow(["Residue", "Residue_ID", "Phi (degrees)", "Psi (degrees)"])
+
+    for residue_data in phi_psi_data:
+        residue_name = residue_data[0]
+        residue_id = residue_data[1]
+        phi = round(residue_data[2], 2)  # 丸める
+        psi = round(residue_data[3], 2)  # 丸める
+        csv_writer.writerow([residue_name, residue_id, phi, psi])
+
+# バックグラウンドで処理する依頼のキューと、結果を画面に戻すためのキュー
+# 依頼は1つのワーカースレッドが順に処理し、Tkの部品は結果を受け取ったメインスレッドだけが操作します。
+job_queue = queue.Queue()
+result_queue = queue.Queue()
+
+# 受け付けてまだ結果を表示していない依頼（メインスレッドだけが操作します）
+active_jobs = []
+
+# 結果のキューを確認する間隔（ミリ秒）
+POLL_INTERVAL_MS = 100
+
+class AnalysisCancelled(Exception):
+    pass
+
+# 構造ファイルをメモリマップで開き、各行の先頭位置の配列を作る関数
+# 戻り値は(メモリマップ, 行の先頭位置と最後にファイルの大きさを加えた配列)で、空のファイルではメモリマップがNoneになります。
+def build_line_index(filename):
+    if os.path.getsize(filename) == 0:
+        return None, np.zeros(1, dtype=np.int64)
+
+    with open(filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    newlines = np.flatnonzero(np.frombuffer(mm, dtype=np.uint8) == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    if starts[-1] == len(mm):
+        starts = starts[:-1]  # 最後の改行の後ろは行として数えません
+
+    return mm, np.append(starts, len(mm)).astype(np.int64)
+
+# 大きな構造ファイルでもTkのTextに全体を入れずに、見えている行だけをメモリマップから読んで表示するビューア
+# Textとスクロールバーは呼び出し側で配置し、スクロールはファイル全体の行数に対して行います。
+class LazyTextViewer:
+    def __init__(self, text, scrollbar):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.mm = None
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.first_line = 0
+        self.last_query = None
+        self.last_match = None
+
+        self.scrollbar.config(command=self.yview)
+        self.text.config(state=tk.DISABLED)
+        self.text.tag_configure("highlight", background="yellow")
+
+        self.text.bind("<MouseWheel>", lambda event: self.scroll(-3 if event.delta > 0 else 3))
+        self.text.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.text.bind("<Button-5>", lambda event: self.scroll(3))
+        self.text.bind("<Up>", lambda event: self.scroll(-1))
+        self.text.bind("<Down>", lambda event: self.scroll(1))
+        self.text.bind("<Prior>", lambda event: self.scroll(-self.visible_line_count()))
+        self.text.bind("<Next>", lambda event: self.scroll(self.visible_line_count()))
+        self.text.bind("<Configure>", lambda event: self.show(self.first_line))
+
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    # Textの高さに入る行数を返す関数（まだ表示されていなければ設定した高さを使います）
+    def visible_line_count(self):
+        linespace = tkfont.Font(font=self.text["font"]).metrics("linespace")
+        height = self.text.winfo_height()
+        if height <= 1:
+            return int(self.text["height"])
+        return max(1, height // linespace)
+
+    # 表示するファイルを切り替える関数（前のファイルのメモリマップは閉じます）
+    def set_file(self, mm, offsets):
+        if self.mm is not None:
+            self.mm.close()
+        self.mm = mm
+        self.offsets = offsets
+        self.last_query = None
+        self.last_match = None
+        self.show(0)
+
+    def get_lines(self, start, stop):
+        if self.mm is None:
+            return ""
+        return self.mm[self.offsets[start]:self.offsets[stop]].decode(errors="replace")
+
+    # first_line行目から見えている分の行だけをTextに入れる関数（highlight_lineの行は色を付けます）
+    def show(self, first_line, highlight_line=None):
+        visible = self.visible_line_count()
+        total = self.line_count()
+        self.first_line = max(0, min(first_line, total - visible))
+        last_line = min(total, self.first_line + visible)
+
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, self.get_lines(self.first_line, last_line))
+        if highlight_line is not None and self.first_line <= highlight_line < last_line:
+            row = highlight_line - self.first_line + 1
+            self.text.tag_add("highlight", f"{row}.0", f"{row}.end")
+        self.text.config(state=tk.DISABLED)
+
+        if total:
+            self.scrollbar.set(self.first_line / total, last_line / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, lines):
+        self.show(self.first_line + lines)
+        return "break"
+
+    # スクロールバーからの操作（moveto / scroll units / scroll pages）を行の位置に変換する関数
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.show(int(float(args[1]) * self.line_count()))
+        elif args[0] == "scroll":
+            step = self.visible_line_count() if args[2] == "pages" else 1
+            self.scroll(int(args[1]) * step)
+
+    # 指定した行が上から3行目あたりに来るように表示する関数
+    def jump_to_line(self, line):
+        self.show(line - 2, highlight_line=line)
+
+    def line_of_offset(self, offset):
+        return int(np.searchsorted(self.offsets, offset, side="right")) - 1
+
+    # 文字列を探し、見つかった行へ移動する関数（最後まで探したら先頭に戻ります）
+    # 同じ文字列をもう一度探すときは前に見つけた位置の次から、新しい文字列は表示中の先頭の行から探します。
+    # 表示位置はファイルの末尾で詰められるため、次の検索の開始位置は表示位置ではなく見つけた位置で覚えておきます。
+    def find(self, query):
+        if self.mm is None or not query:
+            return False
+        needle = query.encode()
+        if query == self.last_query and self.last_match is not None:
+            start = self.last_match + 1
+        else:
+            start = int(self.offsets[self.first_line])
+        position = self.mm.find(needle, start)
+        if position < 0:
+            position = self.mm.find(needle, 0)
+        if position < 0:
+            return False
+        self.last_query = query
+        self.last_match = position
+        self.jump_to_line(self.line_of_offset(position))
+        return True
+
+    # 鎖IDと残基番号から、その残基の最初の原子の行へ移動する関数（PDB形式とmmCIF形式に対応します）
+    def jump_to_residue(self, chain_id, residue_number):
+        if self.mm is None:
+            return False
+
+        columns = [name.decode() for name in re.findall(rb"(?m)^_atom_site\.(\S+)", self.mm)]
+        if columns:
+            # mmCIFでは_atom_siteのループの列名から鎖IDと残基番号の列を探します（auth_の列がなければlabel_の列を使います）。
+            chain_column = next((columns.index(name) for name in ("auth_asym_id", "label_asym_id") if name in columns), None)
+            number_column = next((columns.index(name) for name in ("auth_seq_id", "label_seq_id") if name in columns), None)
+            if chain_column is None or number_column is None:
+                return False
+            for match in re.finditer(rb"(?m)^(?:ATOM|HETATM)[ \t][^\n]*", self.mm):
+                fields = match.group().split()
+                if len(fields) > max(chain_column, number_column) and fields[chain_column].decode() == chain_id and fields[number_column] == str(residue_number).encode():
+                    self.jump_to_line(self.line_of_offset(match.start()))
+                    return True
+            return False
+
+        # PDB形式では22列目の鎖IDと23-26列目の残基番号で探します（鎖IDが空欄なら22列目は問いません）。
+        chain_pattern = re.escape(chain_id.encode()[:1]) if chain_id else b"."
+        pattern = rb"(?m)^(?:ATOM  |HETATM).{15}" + chain_pattern + (b"%4d" % residue_number)
+        match = re.search(pattern, self.mm)
+        if match is None:
+            return False
+        self.jump_to_line(self.line_of_offset(match.start()))
+        return True
+
+# キャンセルされた依頼なら処理を打ち切る関数（各段階の間で確認します）
+def check_cancelled(job):
+    if job["cancel"].is_set():
+        raise AnalysisCancelled()
+
+# ワーカースレッドで依頼を順に処理し、進み具合と結果をresult_queueに入れる関数
+def analysis_worker():
+    while True:
+        job = job_queue.get()
+        try:
+            check_cancelled(job)
+            result_queue.put(("progress", job, f"Fetching {job['pdb_id']}..."))
+            filename = fetch_pdb(job["pdb_id"])
+
+            check_cancelled(job)
+            result_queue.put(("progress", job, f"Extracting phi/psi of {job['pdb_id']} chain {job['chain_id']}..."))
+            phi_psi_data = extract_phi_psi(job["pdb_id"], job["chain_id"], filename)
+
+            check_cancelled(job)
+            density = None
+            if job["kind"] == "scatter":
+                # 散布図の背景の密度もワーカースレッドで計算しておきます。
+                density = scatter_density(phi_psi_data)
+
+            check_cancelled(job)
+            line_index = None
+            if job["kind"] == "analyze":
+                # ファイル全体は読み込まず、表示用に行の位置だけを調べておきます。
+                line_index = build_line_index(filename)
+
+            result_queue.put(("done", job, {"filename": filename, "phi_psi": phi_psi_data, "line_index": line_index, "density": density}))
+        except AnalysisCancelled:
+            result_queue.put(("cancelled", job, None))
+        except Exception as e:
+            result_queue.put(("error", job, str(e)))
+
+# 入力欄のPDB ID（空白やカンマで区切れば複数）と鎖IDから依頼を作り、キューに入れる関数
+def submit_jobs(kind):
+    pdb_ids = pdb_id_entry.get().replace(",", " ").split()
+    chain_id = chain_id_entry.get().strip()
+    if not pdb_ids:
+        error_label.config(text="Error: Enter a PDB ID.")
+        return
+
+    for pdb_id in pdb_ids:
+        job = {"kind": kind, "pdb_id": pdb_id, "chain_id": chain_id, "cancel": threading.Event()}
+        active_jobs.append(job)
+        job_queue.put(job)
+    update_status()
+
+# 受け付けたすべての依頼をキャンセルする関数（実行中の段階が終わった時点で止まります）
+def cancel_analysis():
+    for job in active_jobs:
+        job["cancel"].set()
+    update_status()
+
+# 進み具合の表示を更新する関数
+def update_status(message=None):
+    if active_jobs:
+        progress_bar.start(10)
+        waiting = len(active_jobs) - 1
+        status_label.config(text=(message or f"Running {active_jobs[0]['pdb_id']}...") + (f" ({waiting} queued)" if waiting else ""))
+    else:
+        progress_bar.stop()
+        status_label.config(text=message or "Ready")
+
+# after()で定期的に呼ばれ、ワーカースレッドの結果を画面に反映する関数
+def poll_results():
+    # 結果の表示で例外が起きても、次の呼び出しは必ず予約します。
+    try:
+        while True:
+            try:
+                message, job, payload = result_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if message == "progress":
+                if not job["cancel"].is_set():
+                    update_status(payload)
+                continue
+
+            if job in active_jobs:
+                active_jobs.remove(job)
+            if message == "done" and job["cancel"].is_set():
+                # キャンセルされた依頼で開いたメモリマップは閉じます。
+                if payload["line_index"] is not None and payload["line_index"][0] is not None:
+                    payload["line_index"][0].close()
+                message = "cancelled"
+            if message == "done":
+                display_result(job, payload)
+            elif message == "error":
+                error_label.config(text=f"Error: {payload}")
+                update_status(f"Failed {job['pdb_id']}")
+            else:
+                update_status(f"Cancelled {job['pdb_id']}")
+    finally:
+        app.after(POLL_INTERVAL_MS, poll_results)
+
+# 結果を表示し、描画に失敗したときはエラー表示に回す関数
+def display_result(job, payload):
+    try:
+        show_result(job, payload)
+    except Exception as e:
+        error_label.config(text=f"Error: {e}")
+        update_status(f"Failed {job['pdb_id']}")
+    else:
+        update_status(f"Finished {job['pdb_id']} chain {job['chain_id']}")
+
+# 処理が終わった依頼の結果を表示する関数（メインスレッドで実行します）
+def show_result(job, result):
+    error_label.config(text="")
+    if job["kind"] == "scatter":
+        show_scatter_window(plot_scatter(result["phi_psi"], result["density"]), "Phi-Psi Scatter Plot")
+    elif job["kind"] == "scatter_by_aa":
+        show_scatter_window(plot_scatter_by_aa(result["phi_psi"]), "Phi-Psi Scatter Plot by Amino Acid")
+    else:
+        show_analysis(result["phi_psi"], result["line_index"])
+
+def show_analysis(phi_psi_data, line_index):
+    pdb_viewer.set_file(*line_index)
+
+    csv_output = StringIO()
+    csv_writer = csv.writer(csv_output)
+    csv_writer.writerow(["Residue", "Residue_ID", "Phi (degrees)", "Psi (degrees)"])
+    for row in phi_psi_data:
+        csv_writer.writerow(row)
+
+    csv_text.delete('1.0', tk.END)
+    csv_output_str = csv_output.getvalue().replace('\r\n', '\n').replace('\r', '\n')
+    csv_text.insert(tk.END, csv_output_str)
+
+def run_analysis():
+    submit_jobs("analyze")
+
+# 構造ファイルの表示から文字列を探す関数
+def find_in_pdb_text():
+    query = find_entry.get()
+    if pdb_viewer.find(query):
+        error_label.config(text="")
+    else:
+        error_label.config(text=f"Error: '{query}' not found.")
+
+# 構造ファイルの表示を、入力した残基番号（鎖は鎖IDの入力欄）の行へ移動する関数
+def jump_to_residue():
+    try:
+        residue_number = int(residue_entry.get())
+    except ValueError:
+        error_label.config(text="Error: Enter a residue number.")
+        return
+    chain_id = chain_id_entry.get().strip()
+    if pdb_viewer.jump_to_residue(chain_id, residue_number):
+        error_label.config(text="")
+    else:
+        error_label.config(text=f"Error: Residue {residue_number} of chain {chain_id} not found.")
+
+def save_csv():
+    pdb_id = pdb_id_entry.get()
+    chain_id = chain_id_entry.get()
+    default_filename = f"{pdb_id}_{chain_id}.csv"
+    file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")], initialfile=default_filename)
+    if file_path:
+        with open(file_path, "w") as f:
+            f.write(csv_text.get("1.0", tk.END))
+
+# 散布図の背景に描く密度を計算する関数（ワーカースレッドで実行し、密度を推定できないときはNoneを返します）
+def scatter_density(phi_psi_data, nbins=100):
+    # gaussian_kdeは3残基より少ないときや、点が一直線に並ぶときは計算できません。
+    if len(phi_psi_data) < 3:
+        return None
+    x = np.array([round(data[2], 2) for data in phi_psi_data])
+    y = np.array([round(data[3], 2) for data in phi_psi_data])
+    try:
+        k = gaussian_kde([x, y])
+    except (np.linalg.LinAlgError, ValueError):
+        return None
+    xi, yi = np.mgrid[-180:180:nbins * 1j, -180:180:nbins * 1j]
+    zi = k(np.vstack([xi.flatten(), yi.flatten()]))
+    return np.rot90(zi.reshape(xi.shape))
+
+def plot_scatter(phi_psi_data, density=None):
+    fig, ax = plt.subplots()
+    phi = [round(data[2], 2) for data in phi_psi_data]
+    psi = [round(data[3], 2) for data in phi_psi_data]
+    res_ids = [data[1] for data in phi_psi_data]
+
+    x, y = np.array(phi), np.array(psi)
+
+    # ヒートマップを描画（密度はscatter_densityで計算済みで、推定できなかったときは散布図だけを描きます）
+    if density is not None:
+        im = ax.imshow(density, cmap=plt.cm.gist_earth_r,
+                       extent=[-180, 180, -180, 180], alpha=0.5)
+
+    # カラーマップと正規化を作成
+    cmap = plt.get_cmap("coolwarm") # 青から赤へのグラデーション
+    norm = mcolors.Normalize(vmin=min(res_ids), vmax=max(res_ids))
+
+    # 散布図のプロット
+    for i in range(len(phi)):
+        ax.scatter(phi[i], psi[i], color=cmap(norm(res_ids[i])), s=20)  # プロットサイズを小さくする
+
+    ax.set_xlabel('Phi (degrees)')
+    ax.set_ylabel('Psi (degrees)')
+    ax.set_title('Phi-Psi Scatter Plot with Heatmap')
+
+    # x軸とy軸の目盛りを30°間隔に設定
+    ax.set_xticks(np.arange(-180, 181, 30))
+    ax.set_yticks(np.arange(-180, 181, 30))
+
+    # ヒートマップのカラースケールを右側に表示
+    if density is not None:
+        cbar = plt.colorbar(im, ax=ax)
+        cbar.set_label("Density")
+
+    # 散布図のカラースケールを右側に表示
+    sm = cm.ScalarMappable(norm=norm, cmap=cmap)
+    sm.set_array([])
+    cbar_scatter = plt.colorbar(sm, ax=ax)
+    cbar_scatter.set_label("Residue ID")
+
+    return fig
+
+def show_scatter():
+    submit_jobs("scatter")
+
+# 図を新しいトップレベルウィンドウに表示する関数
+def show_scatter_window(fig, title):
+    scatter_window = tk.Toplevel(app)
+    scatter_window.title(title)
+
+    scatter_canvas = FigureCanvasTkAgg(fig, master=scatter_window)
+    scatter_canvas.draw()
+    scatter_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+def plot_scatter_by_aa(phi_psi_data):
+    silver_ratio = math.sqrt(2)
+
+    # ウィンドウサイズを計算
+    height = 5
+    new_width = height * silver_ratio
+
+    fig, ax = plt.subplots(figsize=(new_width, height))
+    
+    # 以下は以前のコードと同じです
+    phi = [round(data[2], 2) for data in phi_psi_data]
+    psi = [round(data[3], 2) for data in phi_psi_data]
+    aa_types = [data[0] for data in phi_psi_data]
+
+    cmap = plt.get_cmap('tab20', len(set(aa_types)))
+
+    plotted_aas = set()
+    for aa, phi_val, psi_val in zip(aa_types, phi, psi):
+        color_idx = list(set(aa_types)).index(aa)
+        if aa not in plotted_aas:
+            ax.scatter(phi_val, psi_val, color=cmap(color_idx), label=aa, s=10)
+            plotted_aas.add(aa)
+        else:
+            ax.scatter(phi_val, psi_val, color=cmap(color_idx), s=10)
+
+    ax.set_xlim(-180, 180)
+    ax.set_ylim(-180, 180)
+    ax.set_xticks(range(-180, 181, 30))
+    ax.set_yticks(range(-180, 181, 30))
+
+    ax.set_xlabel('Phi (degrees)')
+    ax.set_ylabel('Psi (degrees)')
+    ax.set_title('Phi-Psi Scatter Plot by Amino Acid')
+
+    ax.set_aspect('equal')  # プロットエリアを正方形にする
+
+    ax.legend(title="Amino Acids", loc="upper left", bbox_to_anchor=(1.05, 1), fontsize='small', ncol=2)
+
+    fig.tight_layout()
+
+    return fig
+
+def show_scatter_by_aa():
+    submit_jobs("scatter_by_aa")
+
+parser = argparse.ArgumentParser(description="PDB Phi-Psi Analyzer")
+parser.add_argument("--cache-dir", type=str, default=structure_cache["cache_dir"], help=f"Directory for cached structure files (default: {structure_cache['cache_dir']})")
+parser.add_argument("--mirror", type=str, default=None, help="Read-only local mirror of the PDB divided layout (the directory containing mmCIF/ and pdb/)")
+parser.add_argument("--offline", action="store_true", help="Never download; use only the cache and the local mirror")
+parser.add_argument("--max-structures", type=int, default=session_cache["max_structures"], help=f"Parsed structures kept in memory during the session (default: {session_cache['max_structures']})")
+args = parser.parse_args()
+
+session_cache["max_structures"] = max(1, args.max_structures)
+
+structure_cache["cache_dir"] = args.cache_dir
+structure_cache["mirror_dir"] = args.mirror
+structure_cache["offline"] = args.offline
+
+app = tk.Tk()
+app.title("PDB Phi-Psi Analyzer")
+
+frame = ttk.Frame(app, padding="10")
+frame.grid(row=0, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+pdb_id_label = ttk.Label(frame, text="PDB ID:")
+pdb_id_label.grid(row=0, column=0, sticky=tk.W)
+pdb_id_entry = ttk.Entry(frame, width=10)
+pdb_id_entry.grid(row=0, column=1, sticky=tk.W)
+
+chain_id_label = ttk.Label(frame, text="Chain ID:")
+chain_id_label.grid(row=1, column=0, sticky=tk.W)
+chain_id_entry = ttk.Entry(frame, width=10)
+chain_id_entry.grid(row=1, column=1, sticky=tk.W)
+
+analyze_button = ttk.Button(frame, text="Analyze", command=run_analysis)
+analyze_button.grid(row=2, column=0, pady=10)
+
+cancel_button = ttk.Button(frame, text="Cancel", command=cancel_analysis)
+cancel_button.grid(row=2, column=1, pady=10)
+
+progress_bar = ttk.Progressbar(frame, mode="indeterminate", length=200)
+progress_bar.grid(row=3, column=0, columnspan=2, sticky=(tk.W, tk.E))
+
+status_label = ttk.Label(frame, text="Ready")
+status_label.grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
+find_label = ttk.Label(frame, text="Find:")
+find_label.grid(row=5, column=0, sticky=tk.W)
+find_entry = ttk.Entry(frame, width=20)
+find_entry.grid(row=5, column=1, sticky=tk.W)
+find_entry.bind("<Return>", lambda event: find_in_pdb_text())
+find_button = ttk.Button(frame, text="Find", command=find_in_pdb_text)
+find_button.grid(row=5, column=2, padx=(5, 0))
+
+residue_label = ttk.Label(frame, text="Residue:")
+residue_label.grid(row=6, column=0, sticky=tk.W)
+residue_entry = ttk.Entry(frame, width=10)
+residue_entry.grid(row=6, column=1, sticky=tk.W)
+residue_entry.bind("<Return>", lambda event: jump_to_residue())
+residue_button = ttk.Button(frame, text="Go", command=jump_to_residue)
+residue_button.grid(row=6, column=2, padx=(5, 0))
+
+pdb_text = tk.Text(app, wrap=tk.NONE, width=80, height=20)
+pdb_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+# 構造ファイルは見えている行だけを読み込んで表示します。
+pdb_scroll = ttk.Scrollbar(app, orient="vertical")
+pdb_scroll.grid(row=1, column=1, sticky=(tk.N, tk.S))
+pdb_viewer = LazyTextViewer(pdb_text, pdb_scroll)
+
+csv_text = tk.Text(app, wrap=tk.NONE, width=80, height=20)
+csv_text.grid(row=1, column=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+csv_scroll = ttk.Scrollbar(app, orient="vertical", command=csv_text.yview)
+csv_scroll.grid(row=1, column=3, sticky=(tk.N, tk.S))
+csv_text.config(yscrollcommand=csv_scroll.set)
+
+error_label = ttk.Label(app, text="", foreground="red")
+error_label.grid(row=2, column=0, columnspan=2, pady=10)
+
+save_button = ttk.Button(app, text="Save CSV", command=save_csv)
+save_button.grid(row=2, column=1, pady=10)
+
+scatter_button = ttk.Button(app, text="Show Scatter Plot", command=show_scatter)
+scatter_button.grid(row=2, column=3, padx=(0, 10), pady=10)
+
+scatter_by_aa_button = ttk.Button(app, text="Show Scatter Plot by Amino Acid", command=show_scatter_by_aa)
+scatter_by_aa_button.grid(row=2, column=4, padx=(0, 10), pady=10)
+
+app.columnconfigure(0, weight=1)
+app.columnconfigure(1, weight=0)
+app.columnconfigure(2, weight=1)
+app.columnconfigure(3, weight=0)
+app.rowconfigure(1, weight=1)
+
+# 解析はワーカースレッドで行い、結果はafter()で定期的に受け取ります。
+threading.Thread(target=analysis_worker, daemon=True).start()
+app.after(POLL_INTERVAL_MS, poll_results)
+
+app.mainloop()